@@ -0,0 +1,250 @@
+"""
+JSON API for leads.
+
+    GET    api/leads/         list (keyset pages, newest first)
+    POST   api/leads/         create
+    GET    api/leads/<pk>/    detail
+    PATCH  api/leads/<pk>/    partial update
+    DELETE api/leads/<pk>/    delete
+
+List and detail accept ?fields=id,first_name,... to return only some
+fields. The list also takes the lead list filters (search, status, color,
+staff), ?updated_since=<ISO 8601> and ?per_page=, and returns "next" and
+"previous" URLs.
+
+Responses carry an ETag (and, for a single lead, Last-Modified); GETs with
+a matching If-None-Match or If-Modified-Since get an empty 304. PATCH and DELETE honour
+If-Match / If-Unmodified-Since and answer 412 if the lead changed since the
+client read it. A lead's ETag identifies its version (id and updated_at),
+whatever fields were requested.
+
+Requests use the normal login session; POST, PATCH and DELETE also need the
+CSRF token in an X-CSRFToken header.
+"""
+import hashlib
+import json
+from functools import wraps
+from operator import attrgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.forms.models import model_to_dict
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods
+
+from .budgets import query_budget
+from .forms import LeadForm
+from .models import Lead
+from .pagination import KeysetPaginator, cursor_querystring, page_size_from
+from .querysets import id_filter
+from .routers import replica_reads
+
+
+def _staff_username(lead):
+    return lead.assigned_to.username if lead.assigned_to_id else None
+
+
+def _columns(*names):
+    return {name: (name, attrgetter(name)) for name in names}
+
+
+# API field name -> (column passed to only(), value getter), in response order
+API_FIELDS = {
+    'id': ('id', attrgetter('pk')),
+    **_columns(
+        'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact',
+        'prospect_response', 'remarks', 'status', 'color_code', 'source',
+    ),
+    'assigned_to': ('assigned_to', attrgetter('assigned_to_id')),
+    'assigned_to_username': ('assigned_to__username', _staff_username),
+    'duplicate_of': ('duplicate_of', attrgetter('duplicate_of_id')),
+    **_columns('created_at', 'updated_at'),
+}
+# Fields a client may send on create/update (assigned_to is a user id)
+WRITABLE_FIELDS = frozenset(LeadForm.Meta.fields)
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _error(message, status, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def api_view(view):
+    """Session auth answered with 401 JSON instead of a login redirect, and ApiError -> JSON."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Authentication required.', 401)
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return _error(str(e), e.status, **e.extra)
+        except Http404:
+            return _error('Not found.', 404)
+    return wrapper
+
+
+def _requested_fields(params):
+    """Field names from ?fields=, or every API field."""
+    value = params.get('fields', '').strip()
+    if not value:
+        return list(API_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}.", valid_fields=list(API_FIELDS))
+    return fields
+
+
+def _queryset_for(fields):
+    """Leads loading only the columns behind ``fields`` (plus the keyset columns)."""
+    columns = {'id', 'updated_at'} | {API_FIELDS[name][0] for name in fields}
+    queryset = Lead.objects.all()
+    if 'assigned_to__username' in columns:
+        queryset = queryset.with_staff()
+        columns.add('assigned_to')
+    return queryset.only(*columns)
+
+
+def serialize_lead(lead, fields):
+    return {name: API_FIELDS[name][1](lead) for name in fields}
+
+
+def _lead_etag(lead):
+    return f'"{lead.pk}.{lead.updated_at.timestamp():.6f}"'
+
+
+def _last_modified(lead):
+    # HTTP dates have one-second resolution
+    return int(lead.updated_at.timestamp())
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder)
+
+
+def _read_payload(request):
+    try:
+        payload = json.loads(request.body or b'{}')
+    except (TypeError, ValueError):
+        raise ApiError('Request body must be JSON.')
+    if not isinstance(payload, dict):
+        raise ApiError('Request body must be a JSON object.')
+    unknown = sorted(set(payload) - WRITABLE_FIELDS)
+    if unknown:
+        raise ApiError(f"Field(s) not writable: {', '.join(unknown)}.", writable_fields=sorted(WRITABLE_FIELDS))
+    return payload
+
+
+def _save_form(form):
+    if not form.is_valid():
+        raise ApiError('Invalid lead.', errors=form.errors.get_json_data())
+    return form.save(commit=False)
+
+
+def _form_data(payload, instance):
+    """LeadForm data: the instance's values (defaults, for a new lead) overlaid with the payload."""
+    data = model_to_dict(instance, fields=LeadForm.Meta.fields)
+    data.update(payload)
+    return {key: '' if value is None else value for key, value in data.items()}
+
+
+@query_budget(3, POST=7)
+@api_view
+@replica_reads
+@require_http_methods(['GET', 'HEAD', 'POST'])
+def lead_collection(request):
+    if request.method == 'POST':
+        return _create(request)
+
+    fields = _requested_fields(request.GET)
+    try:
+        id_filter(request.GET, 'staff')
+    except ValueError:
+        raise ApiError('staff must be a user id.')
+    queryset = _queryset_for(fields).apply_filters(request.GET)
+    since = request.GET.get('updated_since', '').strip()
+    if since:
+        try:
+            parsed = parse_datetime(since.replace(' ', '+'))
+        except ValueError:
+            # Well formed but out of range, e.g. month 13
+            parsed = None
+        if parsed is None:
+            raise ApiError('updated_since must be an ISO 8601 datetime.')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        queryset = queryset.filter(updated_at__gte=parsed)
+
+    page = KeysetPaginator(queryset, page_size_from(request.GET)).get_page(request.GET.get('cursor'))
+    path = request.build_absolute_uri(request.path)
+
+    response = _json({
+        'results': [serialize_lead(lead, fields) for lead in page],
+        'next': path + cursor_querystring(request.GET, page.next_cursor) if page.has_next else None,
+        'previous': path + cursor_querystring(request.GET, page.prev_cursor) if page.has_previous else None,
+    })
+    # A page's version is the versions of its leads, in order, in this field selection
+    digest = hashlib.md5(','.join(fields).encode(), usedforsecurity=False)
+    for lead in page:
+        digest.update(_lead_etag(lead).encode())
+    # No Last-Modified: a deletion can change a page without raising its newest updated_at
+    response['ETag'] = etag = f'"{digest.hexdigest()}"'
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def _create(request):
+    payload = _read_payload(request)
+    lead = _save_form(LeadForm(_form_data(payload, Lead())))
+    lead.created_by = request.user
+    lead.save()
+    response = _lead_response(lead, list(API_FIELDS), status=201)
+    response['Location'] = request.build_absolute_uri(reverse('leads:api_lead_detail', args=[lead.pk]))
+    return response
+
+
+def _lead_response(lead, fields, status=200):
+    response = _json(serialize_lead(lead, fields), status=status)
+    response['ETag'] = _lead_etag(lead)
+    response['Last-Modified'] = http_date(_last_modified(lead))
+    return response
+
+
+@query_budget(3, PATCH=6, DELETE=10)
+@api_view
+@replica_reads
+@require_http_methods(['GET', 'HEAD', 'PATCH', 'DELETE'])
+def lead_item(request, pk):
+    if request.method in ('GET', 'HEAD'):
+        fields = _requested_fields(request.GET)
+        lead = get_object_or_404(_queryset_for(fields), pk=pk)
+        return get_conditional_response(
+            request, etag=_lead_etag(lead), last_modified=_last_modified(lead),
+            response=_lead_response(lead, fields),
+        )
+
+    lead = get_object_or_404(Lead.objects.for_detail(), pk=pk)
+    # 412 if the client's If-Match / If-Unmodified-Since names an older version
+    stale = get_conditional_response(request, etag=_lead_etag(lead), last_modified=_last_modified(lead))
+    if stale is not None:
+        return stale
+
+    if request.method == 'DELETE':
+        lead.delete()
+        return HttpResponse(status=204)
+    payload = _read_payload(request)
+    lead = _save_form(LeadForm(_form_data(payload, lead), instance=lead))
+    lead.save()
+    return _lead_response(lead, list(API_FIELDS))
@@ -1,7 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _ensure_search_index(sender, using, **kwargs):
+    from .search import ensure_search_index
+    ensure_search_index(using)
 
 
 class LeadsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'leads'
     verbose_name = 'Lead Management'
+
+    def ready(self):
+        from . import checks, db, signals  # noqa: F401
+        # Rebuilding leads_lead on SQLite drops the search triggers; put them back after every migrate
+        post_migrate.connect(_ensure_search_index, sender=self)
@@ -0,0 +1,220 @@
+"""
+Benchmark suite for lead views, search, dashboard stats, exports and imports.
+
+Each benchmark is a function registered with @benchmark. It takes a
+BenchContext (a logged-in test client, the seeded staff and upload files)
+and returns the number of rows it handled, from which rows/s is derived.
+`manage.py bench` seeds synthetic leads up to each requested size and runs
+every benchmark there (see leads/management/commands/bench.py).
+
+Light benchmarks get a warm-up run and are then timed ``repeat`` times;
+heavy ones (full exports and imports) are timed once per size.
+"""
+import io
+import statistics
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .counters import count_leads, dashboard_counts
+from .dedup import DUPLICATES_SKIP
+from .models import Lead
+from .pagination import encode_cursor
+from .readers import HAS_OPENPYXL
+from .services import import_leads_from_file
+from .synthetic import write_synthetic_csv, write_synthetic_xlsx
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    """The benchmark cannot run here (e.g. an optional dependency is missing)."""
+
+
+class BenchmarkError(Exception):
+    """A benchmarked request did not succeed."""
+
+
+class Benchmark:
+
+    def __init__(self, name, func, heavy=False):
+        self.name = name
+        self.func = func
+        self.heavy = heavy
+
+
+def benchmark(name, heavy=False):
+    """Register the decorated function as benchmark ``name``."""
+    def register(func):
+        BENCHMARKS[name] = Benchmark(name, func, heavy)
+        return func
+    return register
+
+
+class BenchContext:
+    """What the benchmarks need at one data size."""
+
+    def __init__(self, client, staff, import_rows):
+        self.client = client
+        self.staff = staff
+        self.import_rows = import_rows
+        self.size = 0
+        # Upload bytes by format, built once and reused at every size
+        self.uploads = {}
+        # Values taken from the seeded data (see prepare())
+        self.sample = {}
+
+    def prepare(self, size):
+        """Pick a lead halfway down the list (for deep pages) and a phone number to search for."""
+        self.size = size
+        middle = Lead.objects.order_by('-updated_at', '-id').only('id', 'updated_at', 'phone_number')[self.size // 2]
+        self.sample = {
+            'deep_cursor': encode_cursor(middle, 'next'),
+            'phone': middle.phone_number,
+        }
+
+    def upload(self, fmt):
+        if fmt not in self.uploads:
+            names = [user.username for user in self.staff]
+            buffer = io.BytesIO()
+            if fmt == 'csv':
+                text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+                write_synthetic_csv(text, self.import_rows, names, seed=1)
+                text.detach()
+            else:
+                write_synthetic_xlsx(buffer, self.import_rows, names, seed=1)
+            self.uploads[fmt] = buffer.getvalue()
+        upload = io.BytesIO(self.uploads[fmt])
+        upload.name = f'bench.{fmt}'
+        return upload
+
+    def get(self, path, params=None):
+        """GET a page through the full middleware stack, reading streamed bodies to the end."""
+        response = self.client.get(path, params or {})
+        if response.status_code != 200:
+            raise BenchmarkError(f'GET {path} returned {response.status_code}')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+
+@benchmark('list_page')
+def list_page(ctx):
+    ctx.get('/')
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('list_filtered')
+def list_filtered(ctx):
+    ctx.get('/', {'status': 'new', 'staff': ctx.staff[0].pk})
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('list_deep_page')
+def list_deep_page(ctx):
+    ctx.get('/', {'cursor': ctx.sample['deep_cursor']})
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('list_rows')
+def list_rows(ctx):
+    """The rows fragment infinite scroll fetches for a deep page."""
+    ctx.get('/rows/', {'cursor': ctx.sample['deep_cursor']})
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('search_name')
+def search_name(ctx):
+    ctx.get('/', {'search': 'okafor'})
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('search_phone')
+def search_phone(ctx):
+    ctx.get('/', {'search': ctx.sample['phone']})
+    return settings.LEADS_PAGE_SIZE
+
+
+@benchmark('dashboard_stats')
+def dashboard_stats(ctx):
+    dashboard_counts()
+    return ctx.size
+
+
+@benchmark('dashboard_recount')
+def dashboard_recount(ctx):
+    """The full aggregation the counters table replaces, for comparison."""
+    count_leads(Lead)
+    return ctx.size
+
+
+@benchmark('export_csv', heavy=True)
+def export_csv(ctx):
+    ctx.get('/download/')
+    return ctx.size
+
+
+@benchmark('export_excel', heavy=True)
+def export_excel(ctx):
+    if not HAS_OPENPYXL:
+        raise SkipBenchmark('openpyxl is not installed')
+    ctx.get('/download/', {'format': 'excel'})
+    return ctx.size
+
+
+def _import(ctx, fmt):
+    upload = ctx.upload(fmt)
+    # Roll the import back so every run (and the next size) starts from the same table
+    with transaction.atomic():
+        imported, errors = import_leads_from_file(upload, duplicates=DUPLICATES_SKIP)
+        transaction.set_rollback(True)
+    if not imported and errors:
+        raise BenchmarkError(errors[0])
+    return ctx.import_rows
+
+
+@benchmark('import_csv', heavy=True)
+def import_csv(ctx):
+    return _import(ctx, 'csv')
+
+
+@benchmark('import_xlsx', heavy=True)
+def import_xlsx(ctx):
+    if not HAS_OPENPYXL:
+        raise SkipBenchmark('openpyxl is not installed')
+    return _import(ctx, 'xlsx')
+
+
+def run_benchmark(bench, ctx, repeat):
+    """
+    Time ``bench`` and return its result: run count, min/median/max
+    milliseconds, SQL queries per run and rows/s at the median.
+    """
+    runs = 1 if bench.heavy else max(1, repeat)
+    if not bench.heavy:
+        bench.func(ctx)  # warm up
+    timings = []
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        for _ in range(runs):
+            start = time.perf_counter()
+            rows = bench.func(ctx)
+            timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        'runs': runs,
+        'min_ms': round(min(timings) * 1000, 3),
+        'median_ms': round(median * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+        'queries': queries // runs,
+        'rows': rows,
+        'rows_per_s': round(rows / median) if median else None,
+    }
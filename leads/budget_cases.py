@@ -0,0 +1,153 @@
+"""
+The requests the query budgets are checked with: one or more cases per
+lead URL and Lead admin view, each built against a BudgetContext for the
+current data size. QueryBudgetTests in leads.tests and
+`manage.py check_query_budgets` both run them (see leads.budgets).
+"""
+import itertools
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from . import urls as lead_urls
+from .budgets import budget_for
+from .bulk import bulk_update_leads
+from .dedup import DUPLICATES_SKIP
+from .models import Lead
+from .pagination import encode_cursor
+
+# The cases edit or delete this many leads at each size, twice
+BUDGET_SPARE_LEADS = 40
+
+
+class BudgetCaseError(Exception):
+    """A case's request failed, so its query count means nothing."""
+
+
+class BudgetContext:
+    """Objects the query budget cases point at, for the current data size."""
+
+    def __init__(self, user, password, staff, job):
+        self.user = user
+        self.password = password
+        self.staff = staff
+        self.job = job
+        self.spare = []
+        self.serial = itertools.count()
+
+    def refresh(self, size):
+        self.spare = list(Lead.objects.order_by('-pk').values_list('pk', flat=True)[:BUDGET_SPARE_LEADS])
+        # Writes touch one counter per changed status/color/staff value, so give the
+        # leads they change the same state at both sizes
+        spare = Lead.objects.filter(pk__in=self.spare)
+        bulk_update_leads(spare, 'status', 'new')
+        bulk_update_leads(spare, 'color_code', '')
+        bulk_update_leads(spare, 'assigned_to_id', None)
+        self.deep = Lead.objects.order_by('-updated_at', '-id').only('id', 'updated_at')[size // 2]
+
+    def lead(self):
+        """A lead no earlier request has deleted."""
+        return self.spare.pop()
+
+
+def _url(name, *args):
+    return reverse(f'leads:{name}', args=args)
+
+
+def _lead_post(ctx):
+    return {
+        'first_name': 'Budget', 'last_name': 'Check', 'status': 'contacted',
+        'color_code': '#28a745', 'assigned_to': ctx.staff[0].pk,
+    }
+
+
+def _upload_post(ctx):
+    serial = next(ctx.serial) % 1000
+    rows = [('Budget', f'Upload{serial}x{i}', f'0803{serial:03d}{i:04d}') for i in range(3)]
+    content = '\n'.join(['first_name,last_name,phone_number', *(','.join(row) for row in rows)]) + '\n'
+    return {'file': SimpleUploadedFile('budget.csv', content.encode()), 'duplicates': DUPLICATES_SKIP}
+
+
+# (label, build(ctx) -> (method, path, data, options)); options: anonymous, json
+CASES = [
+    ('lead_list', lambda ctx: ('get', _url('lead_list'), {}, {})),
+    ('lead_list filtered', lambda ctx: ('get', _url('lead_list'), {'status': 'new', 'staff': ctx.staff[0].pk}, {})),
+    ('lead_list search', lambda ctx: ('get', _url('lead_list'), {'search': 'okafor'}, {})),
+    ('lead_list deep page', lambda ctx: ('get', _url('lead_list'), {'cursor': encode_cursor(ctx.deep, 'next')}, {})),
+    ('lead_rows filtered', lambda ctx: ('get', _url('lead_rows'), {'status': 'new', 'search': 'okafor'}, {})),
+    ('lead_rows next page', lambda ctx: ('get', _url('lead_rows'), {'cursor': encode_cursor(ctx.deep, 'next')}, {})),
+    ('register', lambda ctx: ('get', _url('register'), {}, {'anonymous': True})),
+    ('register POST', lambda ctx: ('post', _url('register'), {
+        'username': f'budget_user_{next(ctx.serial)}', 'password1': ctx.password, 'password2': ctx.password,
+    }, {'anonymous': True})),
+    ('login', lambda ctx: ('get', _url('login'), {}, {'anonymous': True})),
+    ('login POST', lambda ctx: ('post', _url('login'), {
+        'username': ctx.user.username, 'password': ctx.password,
+    }, {'anonymous': True})),
+    ('logout', lambda ctx: ('get', _url('logout'), {}, {})),
+    ('lead_create', lambda ctx: ('get', _url('lead_create'), {}, {})),
+    ('lead_create POST', lambda ctx: ('post', _url('lead_create'), _lead_post(ctx), {})),
+    ('lead_bulk_action', lambda ctx: ('post', _url('lead_bulk_action'), {
+        'action': 'status:won', 'scope': 'selected', 'ids': [ctx.lead() for _ in range(5)],
+    }, {})),
+    ('lead_detail', lambda ctx: ('get', _url('lead_detail', ctx.lead()), {}, {})),
+    ('lead_edit', lambda ctx: ('get', _url('lead_edit', ctx.lead()), {}, {})),
+    ('lead_edit POST', lambda ctx: ('post', _url('lead_edit', ctx.lead()), _lead_post(ctx), {})),
+    ('lead_delete', lambda ctx: ('get', _url('lead_delete', ctx.lead()), {}, {})),
+    ('lead_delete POST', lambda ctx: ('post', _url('lead_delete', ctx.lead()), {}, {})),
+    ('lead_upload', lambda ctx: ('get', _url('lead_upload'), {}, {})),
+    ('lead_upload POST', lambda ctx: ('post', _url('lead_upload'), _upload_post(ctx), {})),
+    ('import_job_detail', lambda ctx: ('get', _url('import_job_detail', ctx.job.pk), {}, {})),
+    ('import_job_progress', lambda ctx: ('get', _url('import_job_progress', ctx.job.pk), {}, {})),
+    ('lead_download csv', lambda ctx: ('get', _url('lead_download'), {}, {})),
+    ('lead_download excel', lambda ctx: ('get', _url('lead_download'), {'format': 'excel'}, {})),
+    ('lead_download since', lambda ctx: ('get', _url('lead_download'), {'since': '1970-01-01T00:00:00Z,0'}, {})),
+    ('lead_download_template', lambda ctx: ('get', _url('lead_download_template'), {}, {})),
+    ('api_lead_list', lambda ctx: ('get', _url('api_lead_list'), {}, {})),
+    ('api_lead_list fields', lambda ctx: ('get', _url('api_lead_list'), {'fields': 'id,assigned_to_username'}, {})),
+    ('api_lead_list POST', lambda ctx: ('post', _url('api_lead_list'), {'first_name': 'Api'}, {'json': True})),
+    ('api_lead_detail', lambda ctx: ('get', _url('api_lead_detail', ctx.lead()), {}, {})),
+    ('api_lead_detail PATCH', lambda ctx: (
+        'patch', _url('api_lead_detail', ctx.lead()), {'status': 'won'}, {'json': True},
+    )),
+    ('api_lead_detail DELETE', lambda ctx: ('delete', _url('api_lead_detail', ctx.lead()), {}, {})),
+    ('admin lead changelist', lambda ctx: ('get', reverse('admin:leads_lead_changelist'), {}, {})),
+    ('admin lead changelist filtered', lambda ctx: ('get', reverse('admin:leads_lead_changelist'), {
+        'status__exact': 'new', 'q': 'okafor',
+    }, {})),
+    ('admin lead change', lambda ctx: ('get', reverse('admin:leads_lead_change', args=[ctx.lead()]), {}, {})),
+]
+
+
+def run_budget_case(ctx, method, path, data, options):
+    """
+    Request ``path`` as one of the CASES, reading streamed bodies.
+    Returns (queries run, resolver match, budget, SQL list).
+    """
+    client = Client()
+    if not options.get('anonymous'):
+        client.force_login(ctx.user)
+    kwargs = {}
+    if options.get('json'):
+        kwargs = {'data': json.dumps(data), 'content_type': 'application/json'}
+    elif data:
+        kwargs = {'data': data}
+    with CaptureQueriesContext(connection) as captured:
+        response = getattr(client, method)(path, **kwargs)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+    if response.status_code >= 400:
+        raise BudgetCaseError(f'{method.upper()} {path} returned {response.status_code}.')
+    match = resolve(path)
+    return len(captured), match, budget_for(match, method), [query['sql'] for query in captured.captured_queries]
+
+
+def uncovered_urls(matches):
+    """Lead URLs none of ``matches`` (resolver matches of the cases run) covers."""
+    covered = {match.url_name for match in matches if match.namespace == 'leads'}
+    return [pattern.name for pattern in lead_urls.urlpatterns if pattern.name not in covered]
@@ -0,0 +1,38 @@
+"""
+Per-view SQL query budgets.
+
+Views declare the most queries one request may run with @query_budget(n),
+next to their other decorators, optionally with a different budget per
+HTTP method (@query_budget(3, POST=13) for a form that is cheap to show
+and dearer to submit); the admin declares them per admin view in
+ModelAdmin.query_budgets. QueryBudgetTests in leads.tests and
+`manage.py check_query_budgets` run the cases in leads.budget_cases,
+requesting every lead URL at two data sizes, and fail if a view exceeds
+its budget or runs more queries on the larger data set (an N+1 query).
+"""
+
+
+def query_budget(queries, **methods):
+    """
+    Declare that a request to the decorated view runs at most ``queries``
+    SQL queries (warm caches), or the budget given for its method.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        view.query_budget_by_method = {method.upper(): budget for method, budget in methods.items()}
+        return view
+    return decorator
+
+
+def budget_of(view, method=None):
+    """The budget declared on ``view`` for ``method``, or None."""
+    return getattr(view, 'query_budget_by_method', {}).get(method, getattr(view, 'query_budget', None))
+
+
+def budget_for(match, method):
+    """The budget for a resolved URL: its view's, or for admin views the ModelAdmin's query_budgets entry."""
+    model_admin = getattr(match.func, 'model_admin', None)
+    if model_admin is not None:
+        # e.g. leads_lead_changelist -> changelist
+        return getattr(model_admin, 'query_budgets', {}).get(match.url_name.rsplit('_', 1)[-1])
+    return budget_of(match.func, method.upper())
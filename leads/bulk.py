@@ -0,0 +1,106 @@
+"""
+Bulk actions on many leads at once: set status, color or staff, or delete.
+
+Leads are processed in primary-key chunks of LEADS_BULK_BATCH_SIZE, one
+transaction per chunk. Each chunk locks its rows, then updates them all
+with a single UPDATE (stamping updated_at itself, since queryset.update()
+skips auto_now) and adjusts the counters with leads.counters.apply_changes,
+as the per-lead signals would have done.
+
+Deletes go through queryset.delete(), so Django's collector handles
+duplicate_of (SET_NULL) and sends the per-lead signals. That costs a
+SELECT of the whole rows per chunk, but the signals' counter and tombstone
+writes are batched (batched_changes, batched_tombstones) into a few
+queries per chunk rather than a few per lead.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import apply_changes, batched_changes
+from .delta import batched_tombstones
+from .models import Lead
+
+ACTION_STATUS = 'status'
+ACTION_COLOR = 'color'
+ACTION_ASSIGN = 'assign'
+ACTION_DELETE = 'delete'
+# Bulk action -> Lead field it sets
+ACTION_FIELDS = {
+    ACTION_STATUS: 'status',
+    ACTION_COLOR: 'color_code',
+    ACTION_ASSIGN: 'assigned_to_id',
+}
+# Position of each settable field in a leads.counters.lead_state() tuple
+_STATE_INDEX = {'status': 0, 'color_code': 1, 'assigned_to_id': 2}
+_STATE_COLUMNS = ('status', 'color_code', 'assigned_to_id')
+
+
+def _chunks(queryset, batch_size):
+    """Yield lists of matching lead ids in primary-key order, re-querying after each chunk."""
+    last_pk = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def _lock(ids, exclude=None):
+    """Lock the leads in ``ids`` and return {pk: counted state}."""
+    rows = Lead.objects.select_for_update().filter(pk__in=ids)
+    if exclude:
+        rows = rows.exclude(**exclude)
+    return {
+        pk: (status, color_code or '', assigned_to_id)
+        for pk, status, color_code, assigned_to_id in rows.order_by().values_list('pk', *_STATE_COLUMNS)
+    }
+
+
+def bulk_update_leads(queryset, field, value, batch_size=None):
+    """
+    Set ``field`` (status, color_code or assigned_to_id) to ``value`` on
+    every lead in ``queryset``. Leads that already have the value are left
+    alone, updated_at included. Returns the number of leads changed.
+    """
+    index = _STATE_INDEX[field]
+    batch_size = batch_size or settings.LEADS_BULK_BATCH_SIZE
+    changed = 0
+    for ids in _chunks(queryset, batch_size):
+        with transaction.atomic(), batched_changes():
+            before = _lock(ids, exclude={field: value})
+            if not before:
+                continue
+            Lead.objects.filter(pk__in=list(before)).update(**{field: value, 'updated_at': timezone.now()})
+            after = []
+            for state in before.values():
+                state = list(state)
+                state[index] = value
+                after.append(tuple(state))
+            apply_changes(added=after, removed=before.values())
+        changed += len(before)
+    return changed
+
+
+def bulk_delete_leads(queryset, batch_size=None):
+    """Delete every lead in ``queryset``. Returns the number of leads deleted."""
+    batch_size = batch_size or settings.LEADS_BULK_BATCH_SIZE
+    deleted = 0
+    for ids in _chunks(queryset, batch_size):
+        with transaction.atomic(), batched_changes(), batched_tombstones():
+            pks = list(_lock(ids))
+            if not pks:
+                continue
+            Lead.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+    return deleted
+
+
+def apply_bulk_action(queryset, action, value=None, batch_size=None):
+    """Run ``action`` (one of the ACTION_* constants) on ``queryset``; returns leads affected."""
+    if action == ACTION_DELETE:
+        return bulk_delete_leads(queryset, batch_size=batch_size)
+    return bulk_update_leads(queryset, ACTION_FIELDS[action], value, batch_size=batch_size)
@@ -0,0 +1,81 @@
+"""
+Versioned caching for lead list choice data and dashboard counts.
+
+Cache keys embed the current version of each namespace they depend on
+(LEADS, USERS). Writers call invalidate(), which gives the namespace a new
+version once the surrounding transaction commits; entries under the old
+version are never read again and simply expire. This works the same with
+the local-memory, file and Redis backends configured in CACHES.
+
+Hits and misses are counted per cached name in this process; see stats().
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+from .routers import primary_reads
+
+LEADS = 'leads'
+USERS = 'users'
+
+_MISSING = object()
+_hits = Counter()
+_misses = Counter()
+_stats_lock = threading.Lock()
+
+
+def _version_key(namespace):
+    return f'leads:version:{namespace}'
+
+
+def _new_version():
+    # Unique across restarts and evictions, unlike a counter starting at 1
+    return time.time_ns()
+
+
+def _versions(namespaces):
+    keys = [_version_key(ns) for ns in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    """Give ``namespaces`` new versions when the current transaction commits."""
+    def bump():
+        cache.set_many({_version_key(ns): _new_version() for ns in namespaces}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def cached(name, namespaces, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the cached value for ``name`` under the current versions of
+    ``namespaces``, calling ``compute()`` and storing its result on a miss.
+    """
+    version = '.'.join(str(v) for v in _versions(namespaces))
+    key = f'leads:{name}:{version}'
+    value = cache.get(key, _MISSING)
+    with _stats_lock:
+        (_misses if value is _MISSING else _hits)[name] += 1
+    if value is _MISSING:
+        # A lagging replica could store pre-invalidation data under the new version
+        with primary_reads():
+            value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def stats():
+    """{name: {'hits': n, 'misses': n}} for every cached name used in this process."""
+    with _stats_lock:
+        return {
+            name: {'hits': _hits[name], 'misses': _misses[name]}
+            for name in sorted(_hits.keys() | _misses.keys())
+        }
@@ -0,0 +1,55 @@
+"""
+System checks for deployment settings the leads app depends on.
+
+    python manage.py check --deploy
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.db import connections
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    leads.cache invalidates by bumping version keys in the cache, which a
+    per-process local-memory cache keeps from every other process.
+    """
+    if settings.CACHES['default']['BACKEND'] != LOCMEM_CACHE:
+        return []
+    hint = 'Set CACHE_BACKEND=file (one server) or CACHE_BACKEND=redis (several servers).'
+    if getattr(settings, 'LEADS_IMPORT_BACKGROUND', False):
+        return [Warning(
+            'The local-memory cache is not shared with the import worker, so '
+            'dashboard counts stay stale after background imports.',
+            hint=hint, id='leads.W002',
+        )]
+    if not settings.DEBUG:
+        return [Warning(
+            'The local-memory cache is per process; with more than one server '
+            'process, lead and staff changes are not seen by the others until '
+            'their cached entries expire.',
+            hint=hint, id='leads.W001',
+        )]
+    return []
+
+
+@register(Tags.database)
+def check_sqlite_request_transactions(app_configs, **kwargs):
+    """
+    With transaction_mode IMMEDIATE every transaction takes SQLite's write
+    lock, so wrapping each request in one would serialize all page views.
+    """
+    warnings = []
+    for alias in connections:
+        options = connections.settings[alias]
+        immediate = options.get('OPTIONS', {}).get('transaction_mode', '').upper() in ('IMMEDIATE', 'EXCLUSIVE')
+        if options['ENGINE'].endswith('sqlite3') and immediate and options.get('ATOMIC_REQUESTS'):
+            warnings.append(Warning(
+                f'Database "{alias}" wraps every request in a transaction, and each one '
+                'takes the SQLite write lock, so requests run one at a time.',
+                hint='Turn ATOMIC_REQUESTS off, or set SQLITE_TRANSACTION_MODE=DEFERRED.',
+                id='leads.W003',
+            ))
+    return warnings
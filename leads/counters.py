@@ -0,0 +1,190 @@
+"""
+Incrementally maintained lead totals for the dashboard.
+
+LeadCounter holds a count per status, color and assigned staff member, plus
+an overall total, so the lead list header reads a handful of rows instead
+of aggregating the whole table on every request.
+
+Counters are kept current by:
+- signals for Lead.save() and delete() (see leads.signals);
+- apply_changes() from code that writes with bulk_create, bulk_update or
+  queryset.update(), which send no per-row signals;
+- the reconcile_lead_counters command, which recounts from the leads table.
+
+Inside ``with batched_changes():`` deltas (including those from signals)
+are summed and written once on exit, so deleting or saving many leads
+costs a few counter UPDATEs rather than several per lead.
+
+Deltas are applied with UPDATE ... SET count = count + n inside the caller's
+transaction, so a rolled-back write rolls its counts back too. Each process
+and thread writes to its own one of COUNTER_SLOTS rows per counter, so
+concurrent writers seldom wait on the same row (the total and the 'new'
+status counter would otherwise be touched by every create and delete).
+Reads sum the slots.
+
+Lead.save() takes the state it replaces from the instance as it was loaded,
+without reading the row again. Saving a copy loaded before someone else
+changed the lead's status, color or staff therefore miscounts; run
+reconcile_lead_counters to correct such drift.
+"""
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .cache import LEADS, invalidate
+from .models import LeadCounter
+
+DIMENSION_TOTAL = LeadCounter.DIMENSION_TOTAL
+DIMENSION_STATUS = LeadCounter.DIMENSION_STATUS
+DIMENSION_COLOR = LeadCounter.DIMENSION_COLOR
+DIMENSION_STAFF = LeadCounter.DIMENSION_STAFF
+# LeadCounter dimension -> Lead field it counts
+DIMENSION_FIELDS = {
+    DIMENSION_STATUS: 'status',
+    DIMENSION_COLOR: 'color_code',
+    DIMENSION_STAFF: 'assigned_to_id',
+}
+# Rows each counter is spread over
+COUNTER_SLOTS = 8
+
+
+def lead_state(lead):
+    """The counted fields of a lead, as passed to apply_changes()."""
+    return (lead.status, lead.color_code or '', lead.assigned_to_id)
+
+
+def _keys(state):
+    status, color_code, assigned_to_id = state
+    return (
+        (DIMENSION_TOTAL, ''),
+        (DIMENSION_STATUS, status or ''),
+        (DIMENSION_COLOR, color_code or ''),
+        (DIMENSION_STAFF, str(assigned_to_id or '')),
+    )
+
+
+_pending = threading.local()
+
+
+@contextmanager
+def batched_changes():
+    """Collect counter deltas made inside the block and write them once at the end."""
+    if getattr(_pending, 'deltas', None) is not None:
+        yield
+        return
+    _pending.deltas = Counter()
+    try:
+        yield
+        deltas = _pending.deltas
+    finally:
+        _pending.deltas = None
+    _apply_deltas(deltas)
+
+
+def apply_changes(added=(), removed=()):
+    """
+    Add one to the counters of every state in ``added`` and subtract one for
+    every state in ``removed``. An update is a removal of the old state plus
+    an addition of the new one; only counters that actually change are written.
+    """
+    pending = getattr(_pending, 'deltas', None)
+    deltas = pending if pending is not None else Counter()
+    for state in added:
+        deltas.update(_keys(state))
+    for state in removed:
+        deltas.subtract(_keys(state))
+    if pending is None:
+        _apply_deltas(deltas)
+
+
+def _apply_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        invalidate(LEADS)
+    # Fixed per thread, so a thread keeps updating rows that already exist
+    slot = hash((os.getpid(), threading.get_ident())) % COUNTER_SLOTS
+    for (dimension, value), delta in sorted(deltas.items()):
+        counter = LeadCounter.objects.filter(dimension=dimension, value=value, slot=slot)
+        if counter.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                LeadCounter.objects.create(dimension=dimension, value=value, slot=slot, count=delta)
+        except IntegrityError:
+            # Created by a concurrent writer since our UPDATE
+            counter.update(count=F('count') + delta)
+
+
+def reassign_staff(user_pk):
+    """Move a deleted staff member's count to unassigned (their leads are SET_NULL)."""
+    counters = LeadCounter.objects.filter(dimension=DIMENSION_STAFF, value=str(user_pk))
+    count = sum(counters.values_list('count', flat=True))
+    if counters.delete()[0]:
+        _apply_deltas({(DIMENSION_STAFF, ''): count})
+
+
+def count_leads(lead_model):
+    """Recount every counter from the leads table: {(dimension, value): count}."""
+    counts = {(DIMENSION_TOTAL, ''): lead_model.objects.count()}
+    for dimension, field in DIMENSION_FIELDS.items():
+        rows = lead_model.objects.order_by().values_list(field).annotate(n=Count('pk'))
+        for value, n in rows:
+            counts[(dimension, str(value or ''))] = n
+    return counts
+
+
+def stored_counts(counter_model):
+    """The counters table with its slots summed: {(dimension, value): count}."""
+    rows = counter_model.objects.order_by().values_list('dimension', 'value').annotate(n=Sum('count'))
+    return {(dimension, value): n for dimension, value, n in rows}
+
+
+def rebuild_counters(lead_model, counter_model):
+    """
+    Recount and overwrite the counters table. Returns {(dimension, value):
+    (stored, actual)} for every counter that had drifted. Counter rows are
+    locked first, so concurrent writers wait and apply their deltas on top.
+    Takes the models as arguments so data migrations can pass historical ones.
+    """
+    with transaction.atomic():
+        stored = Counter()
+        for dimension, value, count in counter_model.objects.select_for_update().values_list(
+            'dimension', 'value', 'count',
+        ):
+            stored[(dimension, value)] += count
+        actual = count_leads(lead_model)
+        drift = {}
+        for key in stored.keys() | actual.keys():
+            count = actual.get(key, 0)
+            if stored[key] != count:
+                drift[key] = (stored[key], count)
+                # Replace the counter's slots with one row holding the recount
+                counter_model.objects.filter(dimension=key[0], value=key[1]).delete()
+                counter_model.objects.create(dimension=key[0], value=key[1], count=count)
+        if drift:
+            invalidate(LEADS)
+    return drift
+
+
+def dashboard_counts():
+    """
+    Current totals in one query:
+    {'total': n, 'status': {status: n}, 'color': {color_code: n}, 'staff': {user_id: n}}.
+    Zero counters are left out; unassigned leads are under staff key None.
+    """
+    counts = {DIMENSION_TOTAL: 0, DIMENSION_STATUS: {}, DIMENSION_COLOR: {}, DIMENSION_STAFF: {}}
+    rows = LeadCounter.objects.order_by().values_list('dimension', 'value').annotate(
+        total=Sum('count'),
+    ).filter(total__gt=0)
+    for dimension, value, count in rows:
+        if dimension == DIMENSION_TOTAL:
+            counts[DIMENSION_TOTAL] = count
+        elif dimension == DIMENSION_STAFF:
+            counts[DIMENSION_STAFF][int(value) if value else None] = count
+        else:
+            counts[dimension][value] = count
+    return counts
@@ -0,0 +1,28 @@
+"""
+Per-connection database tuning.
+
+Every new SQLite connection runs the PRAGMAs in settings.SQLITE_PRAGMAS
+(WAL journal and synchronous=NORMAL by default). The lock wait
+(busy_timeout) is set through the connection's ``timeout`` option in
+DATABASES. Other databases are left alone.
+"""
+import re
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_PRAGMA_TOKEN = re.compile(r'^\w+$')
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if not value:
+                continue
+            if not (_PRAGMA_TOKEN.match(name) and _PRAGMA_TOKEN.match(str(value))):
+                raise ValueError(f'Invalid SQLite PRAGMA {name}={value!r}')
+            cursor.execute(f'PRAGMA {name} = {value}')
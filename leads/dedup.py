@@ -0,0 +1,288 @@
+"""
+Duplicate lead detection with hashed blocking keys.
+
+A lead's blocking keys are its normalised phone number and lowercased
+email; a lead with neither is keyed on its normalised name instead. Two
+leads sharing any key are treated as duplicates. Keys live in a dict, so
+checking a row is O(1) and a whole import is linear in rows.
+"""
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .phone import MIN_LOOKUP_DIGITS, reversed_digits
+
+DUPLICATES_ALLOW = 'allow'
+DUPLICATES_SKIP = 'skip'
+DUPLICATES_UPDATE = 'update'
+DUPLICATES_FLAG = 'flag'
+DUPLICATE_POLICY_CHOICES = [
+    (DUPLICATES_SKIP, 'Skip rows matching an existing lead'),
+    (DUPLICATES_UPDATE, 'Update the existing lead'),
+    (DUPLICATES_FLAG, 'Import and flag as possible duplicate'),
+    (DUPLICATES_ALLOW, 'Import everything'),
+]
+
+KEY_LABELS = {'p': 'phone', 'e': 'email', 'n': 'name'}
+
+
+def normalize_name(first_name, last_name):
+    return ' '.join(f'{first_name} {last_name}'.lower().split())
+
+
+def blocking_keys(phone_digits, email, first_name, last_name):
+    """Return the hashable blocking keys for one lead."""
+    keys = []
+    if len(phone_digits or '') >= MIN_LOOKUP_DIGITS:
+        keys.append('p:' + phone_digits)
+    email = (email or '').strip().lower()
+    if email:
+        keys.append('e:' + email)
+    if not keys:
+        name = normalize_name(first_name or '', last_name or '')
+        if name:
+            keys.append('n:' + name)
+    return keys
+
+
+def lead_keys(lead):
+    return blocking_keys(lead.phone_digits, lead.email, lead.first_name, lead.last_name)
+
+
+class DuplicateIndex:
+    """
+    In-memory blocking-key index. Values are whatever the caller registers:
+    existing lead ids, or unsaved Lead instances from the file being imported.
+    The first value registered for a key wins.
+
+    Existing leads are not loaded up front: load() fetches only those
+    holding the keys of the next batch of rows, so memory grows with the
+    file being imported rather than with the lead table.
+    """
+
+    def __init__(self):
+        self._index = {}
+        self._looked_up = set()
+
+    def load(self, queryset, keys):
+        """
+        Index (by id) the leads in ``queryset`` holding any of ``keys``.
+        Each key is looked up in the database once; the lowest id wins.
+        """
+        keys = set(keys) - self._looked_up
+        if not keys:
+            return
+        self._looked_up |= keys
+        query = Q()
+        phones = [reversed_digits(key[2:]) for key in keys if key[0] == 'p']
+        if phones:
+            query |= Q(phone_digits_reversed__in=phones)
+        emails = [key[2:] for key in keys if key[0] == 'e']
+        if emails:
+            query |= Q(email_lower__in=emails)
+        # A name key's first name is one of its leading words
+        first_names = set()
+        for key in keys:
+            if key[0] == 'n':
+                words = key[2:].split(' ')
+                first_names.update(' '.join(words[:i]) for i in range(1, len(words) + 1))
+        if first_names:
+            query |= Q(first_name_lower__in=first_names)
+        rows = queryset.annotate(
+            email_lower=Lower('email'), first_name_lower=Lower('first_name'),
+        ).filter(query).order_by('pk').values_list('id', 'phone_digits', 'email', 'first_name', 'last_name')
+        for pk, phone_digits, email, first_name, last_name in rows:
+            self.add([key for key in blocking_keys(phone_digits, email, first_name, last_name) if key in keys], pk)
+
+    def find(self, keys):
+        """Return (value, key kind) for the first key already indexed, or None."""
+        for key in keys:
+            value = self._index.get(key)
+            if value is not None:
+                return value, KEY_LABELS[key[0]]
+        return None
+
+    def add(self, keys, value):
+        for key in keys:
+            self._index.setdefault(key, value)
+
+    def replace(self, keys, old, new):
+        """Re-point keys registered to ``old`` at ``new`` (e.g. an instance at its pk)."""
+        for key in keys:
+            if self._index.get(key) is old:
+                self._index[key] = new
+
+    def discard(self, keys, value):
+        """Forget keys registered to ``value`` (e.g. a row whose insert failed)."""
+        for key in keys:
+            if self._index.get(key) is value:
+                del self._index[key]
+
+    def __len__(self):
+        return len(self._index)
+
+
+class _UnionFind:
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [sorted(members) for members in groups.values() if len(members) > 1]
+
+
+def _fuzzy_block_key(name):
+    """Coarse key for the fuzzy pass: first three letters of the first and last name words."""
+    words = name.split()
+    if not words:
+        return None
+    return words[0][:3] + '|' + words[-1][:3]
+
+
+def _contacts_conflict(a, b):
+    """
+    True if two groups both have phone numbers (or both emails) and share
+    none of them, i.e. they are different people with similar names.
+    """
+    return (a[0] and b[0] and a[0].isdisjoint(b[0])) or (a[1] and b[1] and a[1].isdisjoint(b[1]))
+
+
+def find_duplicate_groups(queryset, chunk_size=5000, similarity=0.9, max_block=200):
+    """
+    Group duplicate leads in ``queryset``.
+
+    Pass 1 streams the table once and unions leads sharing a blocking key
+    (phone, email, or name when neither is set). Pass 2 compares names
+    within small blocks (same first three letters of first and last name)
+    using difflib and unions pairs at or above ``similarity``, unless
+    their groups' phone numbers or emails disagree. Blocks larger than
+    ``max_block`` are skipped to keep the pass near-linear.
+
+    Returns (groups, rows_scanned); each group is a sorted list of ids.
+    """
+    from difflib import SequenceMatcher
+
+    uf = _UnionFind()
+    first_by_key = {}
+    fuzzy_blocks = {}
+    row_contacts = {}
+    rows_scanned = 0
+    rows = queryset.order_by().values_list(
+        'id', 'phone_digits', 'email', 'first_name', 'last_name'
+    ).iterator(chunk_size=chunk_size)
+    for pk, phone_digits, email, first_name, last_name in rows:
+        rows_scanned += 1
+        keys = blocking_keys(phone_digits, email, first_name, last_name)
+        for key in keys:
+            first = first_by_key.setdefault(key, pk)
+            if first != pk:
+                uf.union(first, pk)
+        if similarity < 1:
+            name = normalize_name(first_name or '', last_name or '')
+            block = _fuzzy_block_key(name)
+            if block:
+                fuzzy_blocks.setdefault(block, []).append((pk, name))
+            row_contacts[pk] = [key for key in keys if key[0] != 'n']
+    del first_by_key
+
+    # Phone and email keys held by each pass-1 group, merged as groups join
+    group_contacts = {}
+    for pk, keys in row_contacts.items():
+        phones, emails = group_contacts.setdefault(uf.find(pk), (set(), set()))
+        for key in keys:
+            (phones if key[0] == 'p' else emails).add(key)
+    del row_contacts
+
+    # Similar-name pairs between pass-1 groups whose contacts do not disagree
+    partners = {}
+    for members in fuzzy_blocks.values():
+        if len(members) < 2 or len(members) > max_block:
+            continue
+        for i, (pk_a, name_a) in enumerate(members):
+            # SequenceMatcher caches its second sequence, so keep name_a there
+            matcher = SequenceMatcher(None, '', name_a)
+            root_a = uf.find(pk_a)
+            for pk_b, name_b in members[i + 1:]:
+                root_b = uf.find(pk_b)
+                if root_a == root_b or _contacts_conflict(group_contacts[root_a], group_contacts[root_b]):
+                    continue
+                matcher.set_seq1(name_b)
+                if matcher.quick_ratio() >= similarity and matcher.ratio() >= similarity:
+                    partners.setdefault(root_a, set()).add(root_b)
+                    partners.setdefault(root_b, set()).add(root_a)
+    del fuzzy_blocks
+
+    def ambiguous(root):
+        """A group resembling two groups that are different people belongs to neither."""
+        candidates = [group_contacts[other] for other in partners[root]]
+        return any(
+            _contacts_conflict(a, b) for i, a in enumerate(candidates) for b in candidates[i + 1:]
+        )
+
+    for root_a in sorted(partners):
+        if ambiguous(root_a):
+            continue
+        for root_b in sorted(partners[root_a]):
+            if root_b < root_a or ambiguous(root_b):
+                continue
+            joined_a, joined_b = uf.find(root_a), uf.find(root_b)
+            if joined_a != joined_b and not _contacts_conflict(group_contacts[joined_a], group_contacts[joined_b]):
+                uf.union(joined_a, joined_b)
+                contacts_a, contacts_b = group_contacts.pop(joined_a), group_contacts.pop(joined_b)
+                group_contacts[uf.find(joined_a)] = (contacts_a[0] | contacts_b[0], contacts_a[1] | contacts_b[1])
+
+    return uf.groups(), rows_scanned
+
+
+# Fields copied from a merged lead onto the survivor when the survivor's are empty
+MERGE_FILL_FIELDS = (
+    'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact', 'prospect_response',
+    'status', 'color_code', 'source', 'assigned_to_id', 'created_by_id',
+)
+# Values that also count as empty: a survivor still 'new' takes a merged lead's progress
+MERGE_EMPTY_VALUES = {'status': 'new'}
+
+
+def _is_empty(field, value):
+    return not value or value == MERGE_EMPTY_VALUES.get(field)
+
+
+def merge_leads(leads):
+    """
+    Merge a group of Lead instances in memory. The most recently updated
+    lead survives; its empty fields (MERGE_FILL_FIELDS) are filled from the
+    others (newest first) and every distinct remark is appended to its
+    remarks. Returns (survivor, losers).
+    """
+    leads = sorted(leads, key=lambda lead: (lead.updated_at, lead.pk), reverse=True)
+    survivor, losers = leads[0], leads[1:]
+    for field in MERGE_FILL_FIELDS:
+        if _is_empty(field, getattr(survivor, field)):
+            value = next((getattr(lead, field) for lead in losers if not _is_empty(field, getattr(lead, field))), None)
+            if value:
+                setattr(survivor, field, value)
+    remarks = []
+    for lead in leads:
+        remark = (lead.remarks or '').strip()
+        if remark and remark not in remarks:
+            remarks.append(remark)
+    survivor.remarks = '\n\n'.join(remarks)
+    if survivor.duplicate_of_id in {lead.pk for lead in leads}:
+        survivor.duplicate_of_id = None
+    survivor.refresh_phone_digits()
+    return survivor, losers
@@ -1,8 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.contrib.auth.models import User
+from .bulk import ACTION_ASSIGN, ACTION_COLOR, ACTION_DELETE, ACTION_STATUS
+from .cache import USERS, cached
+from .dedup import DUPLICATE_POLICY_CHOICES, DUPLICATES_SKIP
 from .models import Lead
 
 
+def active_staff():
+    """Active users as [{'id', 'username'}], cached until a user changes."""
+    return cached('active_staff', [USERS], lambda: list(
+        User.objects.filter(is_active=True).order_by('username').values('id', 'username')
+    ))
+
+
 class StyledAuthenticationForm(AuthenticationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -59,10 +70,12 @@ class LeadForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        from django.contrib.auth.models import User
-        self.fields['assigned_to'].queryset = User.objects.filter(is_active=True).order_by('username')
-        self.fields['assigned_to'].required = False
-        self.fields['assigned_to'].empty_label = '— Unassigned —'
+        field = self.fields['assigned_to']
+        # The queryset only validates submitted values; the options come from the cache
+        field.queryset = User.objects.filter(is_active=True)
+        field.required = False
+        field.empty_label = '— Unassigned —'
+        field.choices = [('', field.empty_label)] + [(u['id'], u['username']) for u in active_staff()]
 
 
 class LeadUploadForm(forms.Form):
@@ -74,3 +87,71 @@ class LeadUploadForm(forms.Form):
             'accept': '.csv,.xlsx,.xls'
         })
     )
+    duplicates = forms.ChoiceField(
+        choices=DUPLICATE_POLICY_CHOICES,
+        initial=DUPLICATES_SKIP,
+        required=False,
+        label='Duplicates',
+        help_text='Rows with the same phone, email or (if neither) name as an existing lead.',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def clean_duplicates(self):
+        return self.cleaned_data['duplicates'] or DUPLICATES_SKIP
+
+
+class LeadBulkActionForm(forms.Form):
+    """
+    A bulk action from the lead list, applied to the ticked leads or to every
+    lead matching the list filters. ``action`` is posted as "<action>:<value>",
+    e.g. "status:won" or "assign:" to unassign, and cleans to (action, value).
+    """
+
+    SCOPE_SELECTED = 'selected'
+    SCOPE_ALL = 'all'
+    SCOPE_CHOICES = [
+        (SCOPE_SELECTED, 'Selected leads'),
+        (SCOPE_ALL, 'All leads matching the filters'),
+    ]
+
+    action = forms.ChoiceField(
+        error_messages={'required': 'Choose a bulk action.'},
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    scope = forms.ChoiceField(
+        choices=SCOPE_CHOICES, initial=SCOPE_SELECTED,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}),
+    )
+    ids = forms.Field(required=False, widget=forms.MultipleHiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['action'].choices = [
+            ('', 'Bulk action…'),
+            ('Set status', [(f'{ACTION_STATUS}:{v}', label) for v, label in Lead.STATUS_CHOICES]),
+            ('Set color', [(f'{ACTION_COLOR}:{v}', label) for v, label in Lead.COLOR_CHOICES]),
+            ('Assign to', [(f'{ACTION_ASSIGN}:', '— Unassigned —')] + [
+                (f"{ACTION_ASSIGN}:{u['id']}", u['username']) for u in active_staff()
+            ]),
+            (f'{ACTION_DELETE}:', 'Delete'),
+        ]
+
+    def clean_action(self):
+        action, _, value = self.cleaned_data['action'].partition(':')
+        if action == ACTION_ASSIGN:
+            value = int(value) if value else None
+        elif action == ACTION_DELETE:
+            value = None
+        return action, value
+
+    def clean_ids(self):
+        try:
+            return [int(pk) for pk in self.cleaned_data['ids'] or []]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Invalid lead selection.')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('scope') == self.SCOPE_SELECTED and 'ids' in cleaned_data and not cleaned_data['ids']:
+            raise forms.ValidationError('Select at least one lead, or apply the action to all matching leads.')
+        return cleaned_data
@@ -0,0 +1,103 @@
+"""
+Database-backed queue for background lead imports.
+
+Uploads are stored as ImportJob rows; the run_import_worker management
+command claims pending jobs and runs them through import_leads_from_file.
+
+A worker touches its job's heartbeat_at with every batch it commits. If a
+worker dies mid-import, its job stays running with a stale heartbeat;
+after LEADS_IMPORT_STALE_SECONDS another worker claims it and resumes after
+the rows already committed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ImportJob
+from .services import import_leads_from_file
+
+# Seconds a job may wait for a worker before its page warns that none may be running
+WORKER_WAIT_WARNING_SECONDS = 30
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(seconds=settings.LEADS_IMPORT_STALE_SECONDS)
+
+
+def claim_next_job():
+    """
+    Atomically claim the oldest pending job, or failing that a running job
+    whose worker has stopped, and return it. The conditional UPDATE makes
+    claiming safe across worker threads and processes without a broker.
+    Returns None when there is nothing to do.
+    """
+    while True:
+        now = timezone.now()
+        job = ImportJob.objects.filter(status=ImportJob.STATUS_PENDING).defer('errors').order_by('created_at', 'id').first()
+        if job is not None:
+            claimed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_PENDING).update(
+                status=ImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now,
+            )
+        else:
+            job = ImportJob.objects.filter(
+                Q(heartbeat_at__lt=_stale_cutoff()) | Q(heartbeat_at__isnull=True),
+                status=ImportJob.STATUS_RUNNING,
+            ).defer('errors').order_by('created_at', 'id').first()
+            if job is None:
+                return None
+            # Only if no other worker reclaimed it since we read its heartbeat
+            same = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_RUNNING)
+            same = same.filter(heartbeat_at=job.heartbeat_at) if job.heartbeat_at else same.filter(heartbeat_at__isnull=True)
+            claimed = same.update(heartbeat_at=now)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def waiting_for_worker(job):
+    """True if no worker seems to be handling ``job``: queued for a while, or running with a stale heartbeat."""
+    if job.status == ImportJob.STATUS_PENDING:
+        return job.created_at < timezone.now() - timedelta(seconds=WORKER_WAIT_WARNING_SECONDS)
+    if job.status == ImportJob.STATUS_RUNNING:
+        return job.heartbeat_at is None or job.heartbeat_at < _stale_cutoff()
+    return False
+
+
+def run_import_job(job):
+    """
+    Run a claimed job, recording progress as batches commit and the full
+    error list at the end. A reclaimed job resumes after job.rows_processed.
+    """
+    resumed_count = job.success_count
+
+    def progress(rows_processed, success_count):
+        # Called inside the batch's transaction, so progress never runs ahead of the leads written
+        ImportJob.objects.filter(pk=job.pk).update(
+            rows_processed=rows_processed, success_count=resumed_count + success_count,
+            heartbeat_at=timezone.now(),
+        )
+
+    try:
+        with job.file.open('rb') as file:
+            success_count, errors = import_leads_from_file(
+                file, user=job.created_by, progress=progress, duplicates=job.duplicate_policy,
+                skip_rows=job.rows_processed,
+            )
+        success_count += resumed_count
+        status = ImportJob.STATUS_DONE
+    except Exception as e:
+        job.refresh_from_db(fields=['success_count'])
+        success_count, errors = job.success_count, [f"File processing error: {str(e)}"]
+        status = ImportJob.STATUS_FAILED
+
+    job.refresh_from_db(fields=['rows_processed'])
+    job.status = status
+    job.success_count = success_count
+    job.errors = errors
+    job.error_count = len(errors)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'success_count', 'errors', 'error_count', 'finished_at'])
+    job.file.delete(save=False)
+    return job
@@ -0,0 +1,124 @@
+"""
+Run the lead benchmark suite (leads/benchmarks.py) at several data sizes.
+
+    python manage.py bench                                   # 1k and 100k leads
+    python manage.py bench --sizes 1000 100000 1000000 --output before.json
+    python manage.py bench --only list_page search_name --compare before.json
+
+Everything runs in a scratch database created next to the configured one
+and dropped afterwards (see leads.synthetic.scratch_database), so the live
+database is neither changed nor held in a long transaction. Synthetic
+leads are seeded until it holds each size in turn.
+
+Results are written as JSON: run metadata plus, per size and benchmark,
+min/median/max milliseconds, SQL queries per run and rows/s. --compare
+prints each median time per row relative to an earlier results file
+(below 1x is faster).
+"""
+import json
+import platform
+import sys
+from datetime import datetime
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from leads.benchmarks import BENCHMARKS, BenchContext, BenchmarkError, SkipBenchmark, run_benchmark
+from leads.models import Lead
+from leads.synthetic import ensure_staff, scratch_database, seed_leads
+
+BENCH_USERNAME = 'bench_admin'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark lead list, search, stats, export and import at several data sizes; save JSON results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000],
+                            help='Lead counts to benchmark at, e.g. 1000 100000 1000000.')
+        parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='Benchmarks to run (default: all).')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs of each light benchmark.')
+        parser.add_argument('--import-rows', type=int, default=10000, help='Rows in the import benchmark files.')
+        parser.add_argument('--staff', type=int, default=10, help='Staff users to spread leads across.')
+        parser.add_argument('--output', help='Results file (default: bench-<timestamp>.json).')
+        parser.add_argument('--compare', help='Earlier results file to compare median times against.')
+
+    def handle(self, *args, **options):
+        baseline = self._load(options['compare']) if options['compare'] else None
+        names = options['only'] or list(BENCHMARKS)
+        started = datetime.now()
+        results = {}
+
+        # Pages are fetched with the test client (full middleware stack), which uses
+        # host "testserver"; every export would trip the slow-request log
+        quiet = override_settings(ALLOWED_HOSTS=['testserver'], METRICS_SLOW_REQUEST_MS=sys.maxsize)
+        with scratch_database(), quiet:
+            staff = ensure_staff(options['staff'])
+            user, _ = User.objects.get_or_create(username=BENCH_USERNAME, defaults={'is_staff': True})
+            client = Client()
+            client.force_login(user)
+            ctx = BenchContext(client, staff, options['import_rows'])
+
+            for size in sorted(set(options['sizes'])):
+                current = Lead.objects.count()
+                self.stdout.write(f'Seeding {size - current} leads...')
+                seed_leads(size - current, staff, seed=current)
+                ctx.prepare(size)
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{size} leads'))
+                results[str(size)] = self._run_size(ctx, names, options['repeat'], baseline, size)
+
+        output = options['output'] or f'bench-{started:%Y%m%d-%H%M%S}.json'
+        with open(output, 'w', encoding='utf-8') as fh:
+            json.dump({'meta': self._meta(started, options), 'results': results}, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def _run_size(self, ctx, names, repeat, baseline, size):
+        header = f"{'benchmark':<20}{'median ms':>12}{'min ms':>10}{'queries':>9}{'rows/s':>12}"
+        if baseline is not None:
+            header += f"{'vs base':>10}"
+        self.stdout.write(header)
+        results = {}
+        for name in names:
+            try:
+                result = run_benchmark(BENCHMARKS[name], ctx, repeat)
+            except SkipBenchmark as e:
+                self.stdout.write(f'{name:<20}  skipped: {e}')
+                continue
+            except BenchmarkError as e:
+                raise CommandError(f'{name}: {e}')
+            results[name] = result
+            line = (
+                f"{name:<20}{result['median_ms']:>12.2f}{result['min_ms']:>10.2f}"
+                f"{result['queries']:>9}{result['rows_per_s'] or 0:>12}"
+            )
+            base = (baseline or {}).get(str(size), {}).get(name)
+            if base and base['median_ms'] and base['rows']:
+                # Per row, so runs with a different --import-rows still compare
+                ratio = (result['median_ms'] / result['rows']) / (base['median_ms'] / base['rows'])
+                line += f'{ratio:>9.2f}x'
+            self.stdout.write(line)
+        return results
+
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return json.load(fh)['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Cannot read results from {path}: {e}')
+
+    def _meta(self, started, options):
+        return {
+            'started': started.isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': f"{connection.display_name} {'.'.join(map(str, connection.get_database_version()))}",
+            'repeat': options['repeat'],
+            'import_rows': options['import_rows'],
+            'staff': options['staff'],
+        }
@@ -0,0 +1,136 @@
+"""
+Benchmark concurrent reads and writes against the configured database.
+
+    python manage.py bench_db_concurrency --threads 1 4 8 --seconds 10
+    python manage.py bench_db_concurrency --sqlite-modes default tuned
+
+Each thread runs a mix of lead list reads and lead edits (save() in a
+transaction, as lead_edit does) for ``--seconds``. Reports throughput,
+latency percentiles and "database is locked"-style errors per thread count.
+On SQLite, ``--sqlite-modes default`` runs with rollback journal and
+synchronous=FULL for comparison with the tuned WAL settings.
+
+Everything runs in a scratch database created next to the configured one
+(as the test runner does: test_<name> on PostgreSQL, a temporary file on
+SQLite), migrated, seeded with ``--leads`` synthetic leads and dropped
+afterwards, so the live database is never touched.
+"""
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+
+from leads.models import Lead
+from leads.synthetic import ensure_staff, scratch_database, seed_leads
+
+SQLITE_MODES = {
+    'default': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'tuned': None,  # settings.SQLITE_PRAGMAS
+}
+STATUSES = [value for value, _ in Lead.STATUS_CHOICES]
+
+
+class Command(BaseCommand):
+    help = 'Measure lead read/write throughput with several concurrent threads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--leads', type=int, default=5000, help='Synthetic leads inserted for the run.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of operations that edit a lead.')
+        parser.add_argument('--sqlite-modes', nargs='+', choices=sorted(SQLITE_MODES), default=['tuned'])
+
+    def handle(self, *args, **options):
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1.')
+        modes = options['sqlite_modes'] if connection.vendor == 'sqlite' else [None]
+
+        with scratch_database():
+            seed_leads(options['leads'], ensure_staff(5), seed=7)
+            ids = list(Lead.objects.values_list('pk', flat=True))
+            self.stdout.write(f'{connection.vendor}: {len(ids)} synthetic leads, write ratio {options["write_ratio"]}')
+            for mode in modes:
+                pragmas = SQLITE_MODES[mode] if mode else None
+                with override_settings(SQLITE_PRAGMAS=pragmas or settings.SQLITE_PRAGMAS):
+                    # journal_mode is stored in the database file; switch it with one connection open
+                    connections.close_all()
+                    connection.ensure_connection()
+                    if mode:
+                        self.stdout.write(f'\nSQLite {mode}: {self._sqlite_settings()}')
+                    for threads in options['threads']:
+                        self._run(threads, ids, options['seconds'], options['write_ratio'])
+
+    def _sqlite_settings(self):
+        with connection.cursor() as cursor:
+            values = []
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                values.append(f'{pragma}={cursor.fetchone()[0]}')
+        return ', '.join(values)
+
+    def _run(self, threads, ids, seconds, write_ratio):
+        results = []
+        deadline = time.perf_counter() + seconds
+        workers = [
+            threading.Thread(target=self._worker, args=(deadline, ids, write_ratio, seed, results))
+            for seed in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        reads = [t for result in results for t in result['reads']]
+        writes = [t for result in results for t in result['writes']]
+        errors = sum(result['errors'] for result in results)
+        self.stdout.write(
+            f'threads={threads:<3} {(len(reads) + len(writes)) / seconds:8.0f} ops/s  '
+            f'reads {len(reads) / seconds:7.0f}/s p50 {_ms(reads, 50)} p95 {_ms(reads, 95)}  '
+            f'writes {len(writes) / seconds:6.0f}/s p50 {_ms(writes, 50)} p95 {_ms(writes, 95)}  '
+            f'errors {errors}'
+        )
+
+    def _worker(self, deadline, ids, write_ratio, seed, results):
+        rng = random.Random(seed)
+        reads, writes, errors = [], [], 0
+        try:
+            while time.perf_counter() < deadline:
+                write = rng.random() < write_ratio
+                start = time.perf_counter()
+                try:
+                    if write:
+                        self._edit(rng, ids)
+                    else:
+                        self._list(rng)
+                except OperationalError:
+                    errors += 1
+                    continue
+                (writes if write else reads).append(time.perf_counter() - start)
+        finally:
+            connections.close_all()
+        results.append({'reads': reads, 'writes': writes, 'errors': errors})
+
+    def _list(self, rng):
+        queryset = Lead.objects.for_list()
+        if rng.random() < 0.5:
+            queryset = queryset.filter(status=rng.choice(STATUSES))
+        list(queryset.order_by('-updated_at', '-id')[:settings.LEADS_PAGE_SIZE])
+
+    def _edit(self, rng, ids):
+        with transaction.atomic():
+            lead = Lead.objects.get(pk=rng.choice(ids))
+            lead.status = rng.choice(STATUSES)
+            lead.save()
+
+
+def _ms(samples, percentile):
+    if not samples:
+        return '    -'
+    if len(samples) == 1:
+        return f'{samples[0] * 1000:5.1f}'
+    return f'{statistics.quantiles(samples, n=100)[percentile - 1] * 1000:5.1f}'
@@ -0,0 +1,99 @@
+"""
+Seed synthetic leads and compare lead list query plans and latency with
+and without the lead list indexes.
+
+    python manage.py bench_indexes --leads 100000
+
+Everything runs in a scratch database created next to the configured one
+and dropped afterwards (see leads.synthetic.scratch_database), so the
+indexes are never dropped, nor the lead table locked, in the live database.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+
+from leads.models import Lead
+from leads.pagination import KeysetPaginator
+from leads.synthetic import ensure_staff, scratch_database, seed_leads
+
+
+class Command(BaseCommand):
+    help = 'Benchmark lead list queries with and without the lead list indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leads', type=int, default=100000, help='Synthetic leads to seed.')
+        parser.add_argument('--staff', type=int, default=10, help='Staff users to spread leads across.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query.')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            staff = ensure_staff(options['staff'])
+            self.stdout.write(f"Seeding {options['leads']} leads...")
+            seed_leads(options['leads'], staff)
+            cases = self._cases(staff[0].pk)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            with_indexes = self._measure(cases, options['repeat'], 'indexed')
+
+            with connection.cursor() as cursor:
+                for index in Lead._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+            self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+            without_indexes = self._measure(cases, options['repeat'], 'no index')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Median latency (ms)'))
+            self.stdout.write(f"{'query':<28}{'indexed':>10}{'no index':>10}{'speed-up':>10}")
+            for name in cases:
+                a, b = with_indexes[name], without_indexes[name]
+                self.stdout.write(f'{name:<28}{a:>10.2f}{b:>10.2f}{b / a if a else 0:>9.1f}x')
+
+    def _cases(self, staff_id):
+        def page(query):
+            params = QueryDict(query)
+            return lambda: list(KeysetPaginator(Lead.objects.for_list().apply_filters(params), 50).get_page())
+
+        return {
+            'page 1': page(''),
+            'status=new': page('status=new'),
+            'color=#28a745': page('color=%2328a745'),
+            f'staff={staff_id}': page(f'staff={staff_id}'),
+            f'status=won&staff={staff_id}': page(f'status=won&staff={staff_id}'),
+            'status counts': lambda: list(Lead.objects.order_by().values('status').annotate(n=Count('id'))),
+        }
+
+    def _measure(self, cases, repeat, label):
+        results = {}
+        for name, run in cases.items():
+            run()  # warm up
+            timings = []
+            with connection.execute_wrapper(self._capture_sql):
+                self._last_sql = None
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            for _ in range(repeat - 1):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            results[name] = statistics.median(timings) * 1000
+            self.stdout.write(f'{name}: {results[name]:.2f} ms')
+            if self._last_sql:
+                sql, params = self._last_sql
+                with connection.cursor() as cursor:
+                    # The label keeps sqlite3's statement cache from reusing
+                    # the plan prepared before the indexes were dropped.
+                    cursor.execute(f'{self._explain_prefix()}{sql} /* {label} */', params)
+                    for row in cursor.fetchall():
+                        self.stdout.write(f'    {" ".join(str(c) for c in row)}')
+        return results
+
+    def _capture_sql(self, execute, sql, params, many, context):
+        self._last_sql = (sql, params)
+        return execute(sql, params, many, context)
+
+    def _explain_prefix(self):
+        return 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
@@ -0,0 +1,103 @@
+"""
+Check every lead view against its SQL query budget at two data sizes.
+
+    python manage.py check_query_budgets                 # 50 and 500 leads
+    python manage.py check_query_budgets --sizes 100 5000
+
+Each URL in leads.urls (and the Lead admin) is requested through the test
+client by the cases in leads.budget_cases (which QueryBudgetTests also
+runs), once to warm caches and once measured, after seeding synthetic
+leads up to each size. The command fails if a request runs more queries than the budget declared on
+its view for its method (see leads.budgets), or more queries at the larger
+size than at the smaller one, which means a query per row crept in. A URL
+without a case or a view without a budget also fails, so new views cannot
+slip past.
+
+Everything runs in a transaction that is rolled back.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from leads.models import ImportJob, Lead
+from leads.synthetic import ensure_staff, seed_leads
+from leads.budget_cases import (
+    BUDGET_SPARE_LEADS, CASES, BudgetCaseError, BudgetContext, run_budget_case, uncovered_urls,
+)
+
+BUDGET_USERNAME = 'budget_admin'
+BUDGET_PASSWORD = 'budget-check-7Qx'
+
+
+class Command(BaseCommand):
+    help = 'Fail if any lead view runs more SQL queries than its budget, or more as the data grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs=2, default=[50, 500], metavar=('SMALL', 'LARGE'),
+                            help='Lead counts to compare.')
+        parser.add_argument('--show-queries', action='store_true', help='Print the SQL of failing requests.')
+
+    def handle(self, *args, **options):
+        small, large = sorted(options['sizes'])
+        if small == large or small < BUDGET_SPARE_LEADS:
+            raise CommandError(f'--sizes must differ and be at least {BUDGET_SPARE_LEADS}.')
+
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            staff = ensure_staff(5, prefix='budget_staff')
+            user, _ = User.objects.get_or_create(
+                username=BUDGET_USERNAME, defaults={'is_staff': True, 'is_superuser': True},
+            )
+            user.set_password(BUDGET_PASSWORD)
+            user.save()
+            job = ImportJob.objects.create(original_name='budget.csv', file='imports/budget.csv', created_by=user)
+            ctx = BudgetContext(user, BUDGET_PASSWORD, staff, job)
+
+            counts = {}
+            for size in (small, large):
+                current = Lead.objects.count()
+                if current > size:
+                    raise CommandError(f'The database already has {current} leads; use sizes above that.')
+                seed_leads(size - current, staff, seed=current)
+                ctx.refresh(size)
+                for label, build in CASES:
+                    self._request(ctx, *build(ctx))  # warm caches
+                    counts[label, size] = self._request(ctx, *build(ctx))
+
+            transaction.set_rollback(True)
+
+        failures = [
+            f'{name}: no case in leads.budget_cases'
+            for name in uncovered_urls(match for _, match, _, _ in counts.values())
+        ]
+        self.stdout.write(f"{'request':<34}{small:>8}{large:>8}{'budget':>8}")
+        for label, _ in CASES:
+            (low, _, _, _), (high, match, budget, queries) = counts[label, small], counts[label, large]
+            problems = []
+            if budget is None:
+                problems.append(f'no budget declared on {match.view_name}')
+            elif high > budget:
+                problems.append(f'over budget by {high - budget}')
+            if high > low:
+                problems.append(f'grows with data ({low} -> {high})')
+            line = f"{label:<34}{low:>8}{high:>8}{'-' if budget is None else budget:>8}"
+            if problems:
+                failures.append(f"{label}: {', '.join(problems)}")
+                self.stdout.write(self.style.ERROR(f"{line}  {'; '.join(problems)}"))
+                if options['show_queries']:
+                    for sql in queries:
+                        self.stdout.write(f'      {sql}')
+            else:
+                self.stdout.write(line)
+
+        if failures:
+            raise CommandError(f'{len(failures)} query budget failure(s):\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All views within their query budgets.'))
+
+    @staticmethod
+    def _request(ctx, method, path, data, options):
+        """Run one case, reporting a failed request as a CommandError."""
+        try:
+            return run_budget_case(ctx, method, path, data, options)
+        except BudgetCaseError as e:
+            raise CommandError(str(e))
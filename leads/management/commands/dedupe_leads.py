@@ -0,0 +1,128 @@
+"""
+Find and merge duplicate leads already in the database.
+
+    python manage.py dedupe_leads --dry-run        # report groups, change nothing
+    python manage.py dedupe_leads --similarity 0.92
+
+Leads are grouped by shared phone number, email or (when neither is set)
+name, plus a fuzzy name pass within small blocks (see
+leads.dedup.find_duplicate_groups). In each group the most recently
+updated lead is kept, its blanks are filled from the others, their
+remarks are appended to its remarks, and the rest are deleted. Groups are
+merged in batches, one transaction per batch.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from leads.counters import apply_changes, batched_changes, lead_state
+from leads.dedup import MERGE_FILL_FIELDS, find_duplicate_groups, merge_leads
+from leads.delta import batched_tombstones
+from leads.models import Lead
+
+# Every field merge_leads() may change on the survivor
+MERGE_UPDATE_FIELDS = [
+    *(field.removesuffix('_id') for field in MERGE_FILL_FIELDS),
+    'phone_digits', 'phone_digits_reversed', 'remarks', 'duplicate_of', 'updated_at',
+]
+
+
+class Command(BaseCommand):
+    help = 'Merge duplicate leads, keeping the most recently updated lead of each group.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicate groups without merging them.')
+        parser.add_argument('--similarity', type=float, default=0.9,
+                            help='Name similarity (0-1) for the fuzzy pass; 1 disables it.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per query while scanning.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Groups merged per transaction.')
+        parser.add_argument('--show', type=int, default=20, help='Groups listed in the report.')
+
+    def handle(self, *args, **options):
+        if not 0 < options['similarity'] <= 1:
+            raise CommandError('--similarity must be between 0 and 1.')
+
+        start = time.perf_counter()
+        groups, scanned = find_duplicate_groups(
+            Lead.objects.all(), chunk_size=options['chunk_size'], similarity=options['similarity'],
+        )
+        scan_elapsed = time.perf_counter() - start
+        duplicates = sum(len(group) - 1 for group in groups)
+        self.stdout.write(
+            f'Scanned {scanned} leads in {scan_elapsed:.2f}s ({self._rate(scanned, scan_elapsed)} rows/s): '
+            f'{len(groups)} groups, {duplicates} duplicate leads.'
+        )
+
+        if options['dry_run']:
+            self._report(groups[:options['show']])
+            return
+
+        start = time.perf_counter()
+        merged = deleted = 0
+        batch_size = max(1, options['batch_size'])
+        for offset in range(0, len(groups), batch_size):
+            batch = groups[offset:offset + batch_size]
+            deleted += self._merge_batch(batch)
+            merged += len(batch)
+            self.stdout.write(f'  merged {merged}/{len(groups)} groups')
+        merge_elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Merged {merged} groups, deleted {deleted} leads in {merge_elapsed:.2f}s '
+            f'({self._rate(merged, merge_elapsed)} groups/s).'
+        ))
+
+    def _merge_batch(self, groups):
+        """Merge one batch of groups in a single transaction; returns leads deleted."""
+        ids = [pk for group in groups for pk in group]
+        with transaction.atomic(), batched_changes(), batched_tombstones():
+            leads = Lead.objects.select_for_update().in_bulk(ids)
+            survivors, survivor_of, before = [], {}, []
+            for group in groups:
+                members = [leads[pk] for pk in group if pk in leads]
+                if len(members) < 2:
+                    continue
+                states = {lead.pk: lead_state(lead) for lead in members}
+                survivor, losers = merge_leads(members)
+                before.append(states[survivor.pk])
+                survivors.append(survivor)
+                survivor_of.update((lead.pk, survivor.pk) for lead in losers)
+            if not survivors:
+                return 0
+            # bulk_update and update() bypass auto_now, so stamp updated_at for
+            # incremental exports and API syncs to pick the merged leads up
+            now = timezone.now()
+            for survivor in survivors:
+                survivor.updated_at = now
+            Lead.objects.bulk_update(survivors, MERGE_UPDATE_FIELDS)
+            # Survivors may have gained a color or staff member; losers are
+            # counted out by the delete signal
+            apply_changes(added=[lead_state(lead) for lead in survivors], removed=before)
+            # Leads flagged as duplicates of a deleted lead now point at its survivor
+            Lead.objects.filter(duplicate_of__in=list(survivor_of)).update(duplicate_of=Case(
+                *(When(duplicate_of=loser, then=Value(survivor)) for loser, survivor in survivor_of.items()),
+            ), updated_at=now)
+            Lead.objects.filter(pk__in=list(survivor_of)).delete()
+        return len(survivor_of)
+
+    def _report(self, groups):
+        ids = [pk for group in groups for pk in group]
+        leads = Lead.objects.only(
+            'id', 'first_name', 'last_name', 'phone_number', 'email', 'updated_at',
+        ).in_bulk(ids)
+        for group in groups:
+            members = sorted((leads[pk] for pk in group if pk in leads),
+                             key=lambda lead: (lead.updated_at, lead.pk), reverse=True)
+            self.stdout.write('')
+            for i, lead in enumerate(members):
+                marker = 'keep' if i == 0 else 'drop'
+                self.stdout.write(
+                    f'  {marker} #{lead.pk:<7} {lead.first_name} {lead.last_name} | '
+                    f'{lead.phone_number or "-"} | {lead.email or "-"} | {lead.updated_at:%Y-%m-%d %H:%M}'
+                )
+
+    @staticmethod
+    def _rate(count, elapsed):
+        return f'{count / elapsed:.0f}' if elapsed else 'n/a'
@@ -0,0 +1,27 @@
+"""
+Delete old lead tombstones.
+
+    python manage.py prune_lead_tombstones --days 90
+
+Tombstones let incremental exports report deletions. Once every consumer
+has synced past a deletion it is no longer needed; a client whose
+watermark is older than the cutoff should take a full export instead.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from leads.models import LeadTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete lead tombstones older than --days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = LeadTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstone(s) older than {options["days"]} days.'))
@@ -0,0 +1,23 @@
+"""
+Create or repair the lead search index and repopulate it.
+
+    python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from leads.search import get_backend, install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Create or repair the lead full-text search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        with connection.schema_editor() as editor:
+            install_search_index(editor, force=True)
+        backend = get_backend(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Search backend: {type(backend).__name__}'))
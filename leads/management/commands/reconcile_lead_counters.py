@@ -0,0 +1,44 @@
+"""
+Recount the dashboard lead counters from the leads table.
+
+    python manage.py reconcile_lead_counters            # fix any drift and report it
+    python manage.py reconcile_lead_counters --check    # report only; exit 1 on drift
+
+Counters drift only if leads are written without going through save(),
+delete() or leads.counters.apply_changes (e.g. raw SQL); run this after
+such changes, or periodically from cron.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from leads.counters import count_leads, rebuild_counters, stored_counts
+from leads.models import Lead, LeadCounter
+
+
+class Command(BaseCommand):
+    help = 'Recount lead totals per status, color and staff member.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            with transaction.atomic():
+                stored = stored_counts(LeadCounter)
+                actual = count_leads(Lead)
+            drift = {
+                key: (stored.get(key, 0), actual.get(key, 0))
+                for key in stored.keys() | actual.keys()
+                if stored.get(key, 0) != actual.get(key, 0)
+            }
+        else:
+            drift = rebuild_counters(Lead, LeadCounter)
+
+        for (dimension, value), (was, now) in sorted(drift.items()):
+            self.stdout.write(f'  {dimension}={value or "-"}: {was} -> {now}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Counters match the leads table.'))
+        elif options['check']:
+            raise CommandError(f'{len(drift)} counter(s) out of date.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(drift)} counter(s).'))
@@ -0,0 +1,51 @@
+"""
+Run queued lead imports in the background.
+
+    python manage.py run_import_worker              # poll forever, one thread
+    python manage.py run_import_worker --threads 4  # four jobs at a time
+    python manage.py run_import_worker --once       # drain the queue and exit
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from leads.jobs import claim_next_job, run_import_job
+
+
+class Command(BaseCommand):
+    help = 'Process pending lead import jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1, help='Jobs to run concurrently.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        self.stdout.write(f'Import worker started with {threads} thread(s).')
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(self._work, options['interval'], options['once']) for _ in range(threads)]:
+                future.result()
+
+    def _work(self, interval, once):
+        try:
+            while True:
+                close_old_connections()
+                job = claim_next_job()
+                if job is None:
+                    if once:
+                        return
+                    time.sleep(interval)
+                    continue
+                if job.rows_processed:
+                    self.stdout.write(f'Resuming job {job.pk}: {job.original_name} after row {job.rows_processed + 1}')
+                else:
+                    self.stdout.write(f'Importing job {job.pk}: {job.original_name}')
+                job = run_import_job(job)
+                self.stdout.write(
+                    f'Job {job.pk} {job.status}: {job.success_count} imported, {len(job.errors)} error(s).'
+                )
+        finally:
+            connection.close()
@@ -0,0 +1,333 @@
+"""
+Per-request performance metrics, exposed in Prometheus text format.
+
+MetricsMiddleware times every request and, through
+connection.execute_wrapper, counts the SQL queries it runs and their time.
+Observations are labelled with the URL name (e.g. leads:lead_list) rather
+than the path, so a metric's series stay few. For streaming responses
+(CSV exports) the measurement ends when the last chunk has been sent,
+so queries run while streaming are included; a response that is never
+closed is measured up to the next request_finished on its thread, so its
+execute_wrappers cannot pile up on the connections. Recorded per view:
+
+- nissie_request_duration_seconds       latency histogram
+- nissie_request_queries                SQL queries per request, histogram
+- nissie_request_db_seconds             SQL time per request, histogram
+- nissie_response_size_bytes            response body size, histogram
+- nissie_requests_total                 requests by status code
+- nissie_request_rss_growth_bytes_total how far the view raised the
+                                        process's peak memory (RSS)
+
+Requests slower than METRICS_SLOW_REQUEST_MS are logged to the
+leads.metrics logger with their slowest queries. With METRICS_TRACE_MEMORY
+each request's peak Python allocation is traced as well
+(nissie_request_peak_memory_bytes); tracemalloc slows every allocation, so
+it is meant for investigating, not for leaving on.
+
+Metrics live in process memory: each server process reports its own, and
+they reset on restart, as Prometheus expects of counters.
+"""
+import heapq
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .cache import stats as cache_stats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+MEMORY_BUCKETS = (100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+# Slowest queries kept per request for the slow-request log
+SLOW_QUERIES_KEPT = 5
+UNMATCHED_VIEW = '<unmatched>'
+# Anything else is labelled OTHER, so junk methods cannot add series
+KNOWN_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Histogram:
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += 1
+        row[-1] += value
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, row in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            for bound, count in zip(self.buckets, row):
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {count}'
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {row[-2]}'
+            yield f'{self.name}_sum{{{base}}} {_number(row[-1])}'
+            yield f'{self.name}_count{{{base}}} {row[-2]}'
+
+
+class _Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{{{_labels(label_names, labels)}}} {_number(value)}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+VIEW_LABELS = ('view', 'method')
+_lock = threading.Lock()
+_duration = _Histogram('nissie_request_duration_seconds', 'Request latency.', DURATION_BUCKETS)
+_queries = _Histogram('nissie_request_queries', 'SQL queries run per request.', QUERY_BUCKETS)
+_db_time = _Histogram('nissie_request_db_seconds', 'Time spent in SQL queries per request.', DB_TIME_BUCKETS)
+_size = _Histogram('nissie_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+_memory = _Histogram('nissie_request_peak_memory_bytes',
+                     'Peak Python allocation during the request (METRICS_TRACE_MEMORY).', MEMORY_BUCKETS)
+_requests = _Counter('nissie_requests_total', 'Requests by response status.')
+_rss_growth = _Counter('nissie_request_rss_growth_bytes_total',
+                       'Bytes by which requests raised the process peak RSS.')
+
+
+def _peak_rss():
+    """The process's peak resident set size in bytes, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RequestMetrics:
+    """SQL and memory measurements for one request, collected by execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # (duration, sequence, sql) of the slowest queries, smallest first
+        self.slowest = []
+        self.start = time.perf_counter()
+        self.rss_start = _peak_rss()
+        self.trace_memory = settings.METRICS_TRACE_MEMORY and tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            entry = (elapsed, self.queries, sql)
+            if len(self.slowest) < SLOW_QUERIES_KEPT:
+                heapq.heappush(self.slowest, entry)
+            elif elapsed > self.slowest[0][0]:
+                heapq.heappushpop(self.slowest, entry)
+
+    def record(self, request, response, size):
+        duration = time.perf_counter() - self.start
+        match = request.resolver_match
+        view = (match.view_name if match else None) or UNMATCHED_VIEW
+        method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+        labels = (view, method)
+        rss_end = _peak_rss()
+        with _lock:
+            _duration.observe(labels, duration)
+            _queries.observe(labels, self.queries)
+            _db_time.observe(labels, self.db_time)
+            _size.observe(labels, size)
+            _requests.inc((view, method, response.status_code))
+            if rss_end is not None and rss_end > self.rss_start:
+                _rss_growth.inc(labels, rss_end - self.rss_start)
+            if self.trace_memory:
+                _memory.observe(labels, max(0, tracemalloc.get_traced_memory()[1] - self.memory_start))
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            self._log_slow(request, response, view, duration)
+
+    def _log_slow(self, request, response, view, duration):
+        lines = [
+            f'Slow request: {request.method} {request.path} ({view}) -> {response.status_code} '
+            f'in {duration * 1000:.0f} ms, {self.queries} queries in {self.db_time * 1000:.0f} ms'
+        ]
+        for elapsed, _, sql in sorted(self.slowest, reverse=True):
+            lines.append(f'  {elapsed * 1000:8.1f} ms  {" ".join(sql.split())[:500]}')
+        logger.warning('\n'.join(lines))
+
+
+# Measured streams not closed yet, per thread (see close_unfinished_streams)
+_streams = threading.local()
+
+
+def _open_streams():
+    streams = getattr(_streams, 'open', None)
+    if streams is None:
+        streams = _streams.open = []
+    return streams
+
+
+class _MeasuredStream:
+    """
+    Streaming content that counts its bytes. The response closes it once the
+    server has sent it (or the client went away), which ends the measurement
+    even if iteration never started.
+    """
+
+    def __init__(self, content, request, response, metrics, wrappers):
+        self.content = content
+        self.request = request
+        self.response = response
+        self.metrics = metrics
+        self.wrappers = wrappers
+        self.size = 0
+        self.closed = False
+        self.open_streams = _open_streams()
+        self.open_streams.append(self)
+
+    def __iter__(self):
+        for chunk in self.content:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.open_streams.remove(self)
+            self.wrappers.close()
+            self.metrics.record(self.request, self.response, self.size)
+
+
+@receiver(request_finished)
+def close_unfinished_streams(**kwargs):
+    """
+    Fallback for responses nobody closed: end their measurements when a
+    request finishes on the same thread. A closed response has already
+    closed its own stream before sending request_finished.
+    """
+    for stream in list(_open_streams()):
+        stream.close()
+
+
+class MetricsMiddleware:
+    """Measure every request; list it first in MIDDLEWARE so it sees all the others' work too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if settings.METRICS_TRACE_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        wrappers = ExitStack()
+        for alias in connections:
+            wrappers.enter_context(connections[alias].execute_wrapper(metrics))
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            wrappers.close()
+            raise
+        if response.streaming:
+            # Queries run while streaming (e.g. CSV export chunks) count towards this request
+            response.streaming_content = _MeasuredStream(
+                response.streaming_content, request, response, metrics, wrappers,
+            )
+            return response
+        wrappers.close()
+        metrics.record(request, response, len(response.content))
+        return response
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        lines.extend(_duration.render(VIEW_LABELS))
+        lines.extend(_queries.render(VIEW_LABELS))
+        lines.extend(_db_time.render(VIEW_LABELS))
+        lines.extend(_size.render(VIEW_LABELS))
+        lines.extend(_requests.render(('view', 'method', 'status')))
+        lines.extend(_rss_growth.render(VIEW_LABELS))
+        if _memory.series:
+            lines.extend(_memory.render(VIEW_LABELS))
+    peak = _peak_rss()
+    if peak is not None:
+        lines += [
+            '# HELP nissie_process_peak_rss_bytes Peak resident set size of this process.',
+            '# TYPE nissie_process_peak_rss_bytes gauge',
+            f'nissie_process_peak_rss_bytes {peak}',
+        ]
+    lines += [
+        '# HELP nissie_cache_requests_total Cached lookups by name and result (see leads.cache).',
+        '# TYPE nissie_cache_requests_total counter',
+    ]
+    for name, counts in cache_stats().items():
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            labels = _labels(('name', 'result'), (name, result))
+            lines.append(f'nissie_cache_requests_total{{{labels}}} {counts[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. With METRICS_TOKEN set it needs
+    "Authorization: Bearer <token>"; otherwise a logged-in staff user.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
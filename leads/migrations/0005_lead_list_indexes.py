@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0004_import_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['-updated_at', '-id'], name='lead_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['status', '-updated_at', '-id'], name='lead_status_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['color_code', '-updated_at', '-id'], name='lead_color_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['assigned_to', '-updated_at', '-id'], name='lead_staff_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(fields=['assigned_to', 'status', '-updated_at', '-id'], name='lead_staff_status_idx'),
+        ),
+    ]
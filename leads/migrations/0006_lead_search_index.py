@@ -0,0 +1,27 @@
+# Full-text search index for leads (see leads/search.py).
+# SQLite: FTS5 external-content table kept in sync by triggers.
+# PostgreSQL: tsvector and pg_trgm expression indexes.
+# Other databases, or SQLite builds without FTS5, keep using icontains.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from leads.search import install_search_index
+    install_search_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    from leads.search import uninstall_search_index
+    uninstall_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0005_lead_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:39
+
+from django.db import migrations, models
+
+
+def populate_phone_digits(apps, schema_editor):
+    from leads.phone import normalize_phone, reversed_digits
+    Lead = apps.get_model('leads', 'Lead')
+    batch = []
+    for lead in Lead.objects.exclude(phone_number='').only('id', 'phone_number').iterator(chunk_size=2000):
+        lead.phone_digits = normalize_phone(lead.phone_number)
+        lead.phone_digits_reversed = reversed_digits(lead.phone_digits)
+        batch.append(lead)
+        if len(batch) >= 2000:
+            Lead.objects.bulk_update(batch, ['phone_digits', 'phone_digits_reversed'])
+            batch = []
+    Lead.objects.bulk_update(batch, ['phone_digits', 'phone_digits_reversed'])
+
+
+def reinstall_search_index(apps, schema_editor):
+    # Adding columns rebuilds leads_lead on SQLite, which drops the FTS triggers
+    from leads.search import install_search_index
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0006_lead_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, help_text='E.164-style digits of phone_number', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='phone_digits_reversed',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+        migrations.RunPython(populate_phone_digits, migrations.RunPython.noop),
+    ]
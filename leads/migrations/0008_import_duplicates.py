@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reinstall_search_index(apps, schema_editor):
+    # Adding columns may rebuild leads_lead on SQLite, which drops the FTS triggers
+    from leads.search import install_search_index
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0007_lead_phone_digits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='duplicate_policy',
+            field=models.CharField(choices=[('skip', 'Skip rows matching an existing lead'), ('update', 'Update the existing lead'), ('flag', 'Import and flag as possible duplicate'), ('allow', 'Import everything')], default='skip', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Existing lead this one was flagged against on import', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='possible_duplicates', to='leads.lead'),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
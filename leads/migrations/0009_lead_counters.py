@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    from leads.counters import rebuild_counters
+    rebuild_counters(apps.get_model('leads', 'Lead'), apps.get_model('leads', 'LeadCounter'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0008_import_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('status', 'Status'), ('color', 'Color'), ('staff', 'Assigned staff')], max_length=10)),
+                ('value', models.CharField(blank=True, help_text='Status, color code or staff user id; blank for none', max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value'), name='lead_counter_unique')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
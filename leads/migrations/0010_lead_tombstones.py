@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0009_lead_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lead_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'lead_id'], name='lead_tombstone_deleted_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+def populate_error_counts(apps, schema_editor):
+    ImportJob = apps.get_model('leads', 'ImportJob')
+    for job in ImportJob.objects.only('id', 'errors').iterator():
+        if not job.errors:
+            continue
+        job.error_count = len(job.errors)
+        job.save(update_fields=['error_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0010_lead_tombstones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='error_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_error_counts, migrations.RunPython.noop),
+    ]
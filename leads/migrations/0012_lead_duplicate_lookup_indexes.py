@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:22
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0011_import_job_heartbeat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='lead_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lead',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), name='lead_first_name_lower_idx'),
+        ),
+    ]
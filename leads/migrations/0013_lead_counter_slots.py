@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leads', '0012_lead_duplicate_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='leadcounter',
+            name='lead_counter_unique',
+        ),
+        migrations.AddField(
+            model_name='leadcounter',
+            name='slot',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='leadcounter',
+            constraint=models.UniqueConstraint(fields=('dimension', 'value', 'slot'), name='lead_counter_unique'),
+        ),
+    ]
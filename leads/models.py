@@ -2,9 +2,22 @@
 Lead model for Nissie Ideal Shelters Real Estate CRM.
 """
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .dedup import DUPLICATE_POLICY_CHOICES, DUPLICATES_SKIP
+from .phone import normalize_phone, reversed_digits
+from .querysets import LeadQuerySet
 
+# Lead columns the dashboard counters are kept by (see leads.counters)
+COUNTED_FIELDS = ('status', 'color_code', 'assigned_to_id')
+
+
+# Search: on SQLite, leads_lead is mirrored into the leads_lead_fts index by
+# triggers, and search matches word prefixes rather than substrings (see
+# leads/search.py). A migration that rebuilds this table drops the triggers;
+# leads.search.ensure_search_index puts them back after every migrate.
 class Lead(models.Model):
     """Real estate lead/prospect with full tracking."""
 
@@ -33,6 +46,8 @@ class Lead(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100, blank=True)
     phone_number = models.CharField(max_length=50, blank=True)
+    phone_digits = models.CharField(max_length=50, blank=True, editable=False, help_text='E.164-style digits of phone_number')
+    phone_digits_reversed = models.CharField(max_length=50, blank=True, editable=False, db_index=True)
     email = models.EmailField(blank=True)
     point_of_contact = models.CharField(max_length=200, blank=True, help_text='Person or channel they came from')
     prospect_response = models.TextField(blank=True, help_text='Their response or feedback')
@@ -42,15 +57,152 @@ class Lead(models.Model):
     source = models.CharField(max_length=100, blank=True, help_text='Lead source e.g. Website, Referral')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_leads', help_text='Staff member responsible for this lead')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_leads')
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='possible_duplicates', help_text='Existing lead this one was flagged against on import')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LeadQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
+        # Match lead_list/lead_download: optional equality filter on status,
+        # color or staff, then keyset order on (-updated_at, -id).
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='lead_updated_idx'),
+            models.Index(fields=['status', '-updated_at', '-id'], name='lead_status_updated_idx'),
+            models.Index(fields=['color_code', '-updated_at', '-id'], name='lead_color_updated_idx'),
+            models.Index(fields=['assigned_to', '-updated_at', '-id'], name='lead_staff_updated_idx'),
+            models.Index(fields=['assigned_to', 'status', '-updated_at', '-id'], name='lead_staff_status_idx'),
+            # Duplicate lookups on import (see leads.dedup.DuplicateIndex.load)
+            models.Index(Lower('email'), name='lead_email_lower_idx'),
+            models.Index(Lower('first_name'), name='lead_first_name_lower_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}".strip() or self.first_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        lead = super().from_db(db, field_names, values)
+        lead.remember_counted_state()
+        return lead
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_counted_state()
+
+    def remember_counted_state(self):
+        """
+        Note the counted fields as stored, so saving need not read them back
+        (see leads.signals). Leads loaded without them are read on save.
+        """
+        loaded = self.__dict__
+        if all(field in loaded for field in COUNTED_FIELDS):
+            self._saved_counted_state = tuple(loaded[field] for field in COUNTED_FIELDS)
+        else:
+            self._saved_counted_state = None
+
+    def save(self, *args, **kwargs):
+        self.refresh_phone_digits()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits', 'phone_digits_reversed'}
+        super().save(*args, **kwargs)
+
+    def refresh_phone_digits(self):
+        """Recompute the normalised phone columns; call before bulk_create()."""
+        self.phone_digits = normalize_phone(self.phone_number)
+        self.phone_digits_reversed = reversed_digits(self.phone_digits)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}".strip() or self.first_name
+
+
+class ImportJob(models.Model):
+    """A lead upload queued for the background import worker."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    file = models.FileField(upload_to='imports/%Y/%m/')
+    original_name = models.CharField(max_length=255)
+    duplicate_policy = models.CharField(max_length=10, choices=DUPLICATE_POLICY_CHOICES, default=DUPLICATES_SKIP)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    rows_processed = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    # Kept next to errors so progress polls need not load the whole list
+    error_count = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Touched by the worker after every batch; a running job whose heartbeat
+    # stops is reclaimed by another worker (see leads.jobs.claim_next_job)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.original_name} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class LeadCounter(models.Model):
+    """
+    Running lead total for one status, color or staff member (see
+    leads.counters). Each total is split over several slot rows that are
+    summed on read, so concurrent writers rarely update the same row.
+    """
+
+    DIMENSION_TOTAL = 'total'
+    DIMENSION_STATUS = 'status'
+    DIMENSION_COLOR = 'color'
+    DIMENSION_STAFF = 'staff'
+    DIMENSION_CHOICES = [
+        (DIMENSION_TOTAL, 'Total'),
+        (DIMENSION_STATUS, 'Status'),
+        (DIMENSION_COLOR, 'Color'),
+        (DIMENSION_STAFF, 'Assigned staff'),
+    ]
+
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=50, blank=True, help_text='Status, color code or staff user id; blank for none')
+    slot = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value', 'slot'], name='lead_counter_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}={self.value or '-'} [{self.slot}]: {self.count}"
+
+
+class LeadTombstone(models.Model):
+    """A deleted lead, so incremental exports can report the deletion (see leads.delta)."""
+
+    lead_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'lead_id'], name='lead_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Lead {self.lead_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,141 @@
+"""
+Keyset (cursor) pagination for lead listings.
+
+Pages are addressed by the (updated_at, id) of the row at the page edge
+instead of an OFFSET, so fetching page N costs the same as page 1. Ranked
+search results are paged the same way on (search_rank, id).
+"""
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'leads.pagination.cursor'
+# Keyset column -> its key in the cursor payload
+CURSOR_KEYS = {'updated_at': 'u', 'search_rank': 'r'}
+
+
+def encode_cursor(lead, direction, field='updated_at'):
+    """Return an opaque cursor pointing at ``lead`` for the given direction."""
+    value = getattr(lead, field)
+    return signing.dumps(
+        {CURSOR_KEYS[field]: value.isoformat() if field == 'updated_at' else value, 'i': lead.pk, 'd': direction},
+        salt=CURSOR_SALT, compress=True,
+    )
+
+
+def decode_cursor(token, field='updated_at'):
+    """
+    Decode a cursor produced by encode_cursor for the same ``field``.
+    Returns (value, id, direction) or None if the token is invalid.
+    """
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        value = data[CURSOR_KEYS[field]]
+        value = parse_datetime(value) if field == 'updated_at' else float(value)
+        pk = int(data['i'])
+        direction = data['d']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+    if value is None or direction not in ('next', 'prev'):
+        return None
+    return value, pk, direction
+
+
+def page_size_from(params):
+    """Page size from ?per_page=, falling back to LEADS_PAGE_SIZE and capped at LEADS_MAX_PAGE_SIZE."""
+    try:
+        size = int(params.get('per_page', settings.LEADS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = settings.LEADS_PAGE_SIZE
+    return max(1, min(size, settings.LEADS_MAX_PAGE_SIZE))
+
+
+def cursor_querystring(params, cursor):
+    """Querystring for the same filters, positioned at ``cursor``."""
+    query = params.copy()
+    query['cursor'] = cursor
+    return '?' + query.urlencode()
+
+
+class KeysetPage:
+    """One page of results plus the cursors for its neighbours."""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate a Lead queryset in (-updated_at, -id) order, or for a ranked
+    search (see LeadQuerySet.keyset_field) in (-search_rank, -id) order.
+
+    Only page_size + 1 rows are fetched per page; the extra row tells us
+    whether another page exists in the direction of travel.
+    """
+
+    def __init__(self, queryset, page_size):
+        self.queryset = queryset
+        self.page_size = max(1, int(page_size))
+        self.field = queryset.keyset_field()
+
+    def get_page(self, cursor=None):
+        field = self.field
+        decoded = decode_cursor(cursor, field)
+        qs = self.queryset
+        if decoded is None:
+            direction = 'next'
+            rows = list(qs.order_by(f'-{field}', '-id')[:self.page_size + 1])
+        else:
+            value, pk, direction = decoded
+            if direction == 'next':
+                qs = qs.filter(
+                    Q(**{f'{field}__lt': value}) |
+                    Q(**{field: value, 'id__lt': pk})
+                ).order_by(f'-{field}', '-id')
+            else:
+                qs = qs.filter(
+                    Q(**{f'{field}__gt': value}) |
+                    Q(**{field: value, 'id__gt': pk})
+                ).order_by(field, 'id')
+            rows = list(qs[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if direction == 'prev':
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([])
+
+        if direction == 'next':
+            has_next, has_prev = has_more, decoded is not None
+        else:
+            has_next, has_prev = True, has_more
+
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1], 'next', field) if has_next else None,
+            prev_cursor=encode_cursor(rows[0], 'prev', field) if has_prev else None,
+        )
@@ -0,0 +1,53 @@
+"""
+Phone number normalisation for lookup and duplicate detection.
+
+Numbers are reduced to E.164-style digits (country code included, no '+').
+National numbers written with a leading trunk 0 get LEADS_DEFAULT_COUNTRY_CODE,
+so "+234 800 123 4567", "00234 800 123 4567" and "0800 123 4567" all become
+"2348001234567".
+"""
+import re
+
+from django.conf import settings
+from django.db.models import Q
+
+_NON_DIGITS = re.compile(r'\D')
+# Characters a pasted phone number may contain besides digits
+_PHONE_LIKE = re.compile(r'^\+?[\d\s().\-/]+$')
+MIN_LOOKUP_DIGITS = 6
+
+
+def normalize_phone(value):
+    """Return the E.164-style digits for ``value`` ('' if it has no digits)."""
+    value = (value or '').strip()
+    digits = _NON_DIGITS.sub('', value)
+    if not digits or value.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    country_code = getattr(settings, 'LEADS_DEFAULT_COUNTRY_CODE', '')
+    if digits.startswith('0') and country_code:
+        return country_code + digits[1:]
+    return digits
+
+
+def reversed_digits(digits):
+    """Key stored in Lead.phone_digits_reversed; a suffix of the number is a prefix of this."""
+    return digits[::-1]
+
+
+def looks_like_phone(term):
+    """True if a search term is a pasted phone number rather than free text."""
+    term = (term or '').strip()
+    return bool(_PHONE_LIKE.match(term)) and len(_NON_DIGITS.sub('', term)) >= MIN_LOOKUP_DIGITS
+
+
+def phone_match(term):
+    """
+    Q for leads whose number equals or ends with the number in ``term``.
+    It is a range scan on the indexed reversed digits, so an index seek
+    however many leads there are.
+    """
+    key = reversed_digits(normalize_phone(term))
+    # ':' sorts straight after '9', bounding every key that starts with ``key``
+    return Q(phone_digits_reversed__gte=key, phone_digits_reversed__lt=key + ':')
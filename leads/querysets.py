@@ -0,0 +1,97 @@
+"""
+Shared queryset building for lead views, exports and the admin.
+
+Each consumer asks for the shape it needs (list, detail, export) so staff
+are joined in the same query and large text columns are only loaded where
+they are actually shown.
+"""
+from django.db import models
+from django.db.models.functions import Substr
+
+from .search import search_leads
+
+# Columns rendered by lead_list.html; prospect_response is served as a snippet
+LIST_FIELDS = (
+    'id', 'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact',
+    'status', 'color_code', 'updated_at', 'duplicate_of', 'assigned_to__username',
+)
+# Columns written by the CSV/Excel exporters
+EXPORT_FIELDS = (
+    'id', 'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact',
+    'prospect_response', 'remarks', 'status', 'color_code', 'source',
+    'created_at', 'updated_at', 'assigned_to__username',
+)
+# Long enough for truncatewords:8 in the list template
+RESPONSE_SNIPPET_LENGTH = 200
+# Largest id a filter may name (a signed 64-bit primary key)
+MAX_FILTER_ID = 2 ** 63 - 1
+
+
+def id_filter(params, name):
+    """
+    The id in filter ``name`` of ``params``, or None if it is not set.
+    Raises ValueError if the value is not a positive integer id.
+    """
+    value = params.get(name, '')
+    if not value:
+        return None
+    value = int(value)
+    if not 0 < value <= MAX_FILTER_ID:
+        raise ValueError(f'{name} out of range: {value}')
+    return value
+
+
+class LeadQuerySet(models.QuerySet):
+
+    def with_staff(self):
+        """Join the assigned staff member so lead.assigned_to costs no query."""
+        return self.select_related('assigned_to')
+
+    def for_list(self):
+        """Only the columns shown on the lead list, plus a short response snippet."""
+        return self.with_staff().only(*LIST_FIELDS).annotate(
+            response_snippet=Substr('prospect_response', 1, RESPONSE_SNIPPET_LENGTH),
+        )
+
+    def for_detail(self):
+        """Everything on the lead plus its assigned staff member."""
+        return self.with_staff()
+
+    def for_export(self):
+        """The columns written by the exporters, with staff joined."""
+        return self.with_staff().only(*EXPORT_FIELDS)
+
+    def search(self, term, ranked=False):
+        """Filter with the configured search backend (see leads.search)."""
+        return search_leads(self, term, ranked=ranked)
+
+    def keyset_field(self):
+        """Leading keyset pagination column: relevance for a ranked search, otherwise updated_at."""
+        return 'search_rank' if 'search_rank' in self.query.annotations else 'updated_at'
+
+    def apply_filters(self, params, ranked=False):
+        """
+        Apply the lead list search/status/color/staff filters from a QueryDict.
+        With ``ranked``, a search is ordered by relevance where the backend
+        can rank (see leads.search). A staff filter that is not a user id
+        matches no leads, as an unknown status does.
+        """
+        queryset = self.search(params.get('search', ''), ranked=ranked)
+
+        status_filter = params.get('status', '')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+
+        color_filter = params.get('color', '')
+        if color_filter:
+            queryset = queryset.filter(color_code=color_filter)
+
+        try:
+            staff_filter = id_filter(params, 'staff')
+        except ValueError:
+            # Not a user id, so no lead is assigned to it
+            return queryset.none()
+        if staff_filter is not None:
+            queryset = queryset.filter(assigned_to_id=staff_filter)
+
+        return queryset
@@ -0,0 +1,51 @@
+"""
+Streaming row readers for lead uploads.
+
+Each reader yields rows (lists of cell values) one at a time, header row
+first, so an upload is never materialised in memory as a whole.
+"""
+import csv
+import io
+
+try:
+    from openpyxl import load_workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+
+class UnsupportedFileError(ValueError):
+    """The upload cannot be read; the message is shown to the user."""
+
+
+def iter_csv_rows(file):
+    """Decode a CSV upload incrementally and yield its rows."""
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # Leave the underlying upload open for its owner
+        text.detach()
+
+
+def iter_xlsx_rows(file):
+    """Yield the rows of the active sheet of an Excel upload."""
+    if not HAS_OPENPYXL:
+        raise UnsupportedFileError('Excel support requires openpyxl. Run: pip install openpyxl')
+    wb = load_workbook(filename=file, read_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def iter_rows(file):
+    """Yield the rows of a CSV or Excel upload, picking the reader from its name."""
+    filename = file.name.lower()
+    if filename.endswith('.csv'):
+        return iter_csv_rows(file)
+    if filename.endswith(('.xlsx', '.xls')):
+        return iter_xlsx_rows(file)
+    raise UnsupportedFileError('Unsupported file format. Use CSV or Excel.')
@@ -0,0 +1,109 @@
+"""
+Read-replica routing for read-only lead views.
+
+Views decorated with @replica_reads run their queries against the
+``replica`` database alias when one is configured (see DB_REPLICA_HOST in
+settings); everything else, and every write, uses ``default``.
+
+Read-your-writes: ReplicaStickinessMiddleware records in the session when
+a user last changed something, and for DB_REPLICA_STICKY_SECONDS after
+that their reads stay on the primary, so the page they are redirected to
+after saving never shows replica lag.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+STICKY_SESSION_KEY = 'leads_primary_until'
+
+_read_alias = contextvars.ContextVar('leads_read_alias', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def read_alias():
+    """Alias reads are routed to in the current context (None = default routing)."""
+    return _read_alias.get()
+
+
+def pinned_to_primary(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(STICKY_SESSION_KEY, 0) > time.time()
+
+
+@contextmanager
+def reads_from(alias):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def replica_reads(view):
+    """
+    Route the view's GET/HEAD reads to the replica, unless the user recently
+    wrote. Other methods read from the primary, since they may write.
+    Querysets consumed after the view returns (streamed responses) must be
+    bound with ``.using(read_alias())`` inside the view.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not replica_configured() or pinned_to_primary(request):
+            return view(request, *args, **kwargs)
+        with reads_from(REPLICA_DB_ALIAS):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def primary_reads():
+    """Read from the primary inside a replica_reads view, e.g. before caching a value."""
+    return reads_from(None)
+
+
+class ReplicaRouter:
+    """Reads follow replica_reads; writes and migrations always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either may be related
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB_ALIAS:
+            return False
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Keep a user's reads on the primary for a while after a successful write request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+            and replica_configured()
+            and hasattr(request, 'session')
+            and request.user.is_authenticated
+        ):
+            request.session[STICKY_SESSION_KEY] = time.time() + settings.DB_REPLICA_STICKY_SECONDS
+        return response
@@ -0,0 +1,257 @@
+"""
+Search backends for leads.
+
+One search definition (SEARCH_FIELDS) is shared by the lead list and the
+export. The backend is picked from LEADS_SEARCH_BACKEND:
+
+- 'sqlite_fts': an FTS5 index (leads_lead_fts) kept in sync by triggers,
+  so save(), bulk_create(), update() and delete() all maintain it.
+- 'postgres': a tsvector expression index for word-prefix matching plus a
+  pg_trgm index for substring matches, ranked with ts_rank.
+- 'icontains': the portable LIKE '%term%' fallback.
+- 'auto' (default): the index for the current database if it exists,
+  otherwise icontains.
+
+Matching differs by backend. icontains and postgres find any substring
+("kafor" finds "Okafor"). sqlite_fts matches word prefixes only: every
+word of the term must start a word in the lead ("oka" finds "Okafor",
+"kafor" does not).
+
+A migration that rebuilds leads_lead on SQLite drops the FTS triggers.
+ensure_search_index() runs after every migrate (see LeadsConfig.ready) and
+reinstalls them, so migrations need not do it themselves.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import BooleanField, F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .phone import looks_like_phone, phone_match
+
+SEARCH_FIELDS = (
+    'first_name', 'last_name', 'phone_number', 'email', 'remarks', 'point_of_contact',
+)
+
+FTS_TABLE = 'leads_lead_fts'
+
+# Indexed by install_search_index() and matched by PostgresBackend
+PG_DOCUMENT_SQL = (
+    "(coalesce({t}first_name, '') || ' ' || coalesce({t}last_name, '') || ' ' || "
+    "coalesce({t}phone_number, '') || ' ' || coalesce({t}email, '') || ' ' || "
+    "coalesce({t}remarks, '') || ' ' || coalesce({t}point_of_contact, ''))"
+)
+
+_FTS_COLUMNS = ', '.join(SEARCH_FIELDS)
+_FTS_NEW = ', '.join(f'new.{f}' for f in SEARCH_FIELDS)
+_FTS_OLD = ', '.join(f'old.{f}' for f in SEARCH_FIELDS)
+
+SQLITE_INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_FTS_COLUMNS}, content='leads_lead', content_rowid='id', tokenize='unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON leads_lead BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON leads_lead BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_FTS_OLD});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_FTS_COLUMNS} ON leads_lead BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_FTS_COLUMNS}) VALUES ('delete', old.id, {_FTS_OLD});
+        INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_NEW});
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+PG_INSTALL_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    "CREATE INDEX IF NOT EXISTS lead_search_tsv_idx ON leads_lead "
+    f"USING gin (to_tsvector('simple', {PG_DOCUMENT_SQL.format(t='')}))",
+    "CREATE INDEX IF NOT EXISTS lead_search_trgm_idx ON leads_lead "
+    f"USING gin ({PG_DOCUMENT_SQL.format(t='')} gin_trgm_ops)",
+]
+PG_UNINSTALL_SQL = [
+    'DROP INDEX IF EXISTS lead_search_trgm_idx',
+    'DROP INDEX IF EXISTS lead_search_tsv_idx',
+]
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokens(term):
+    return _TOKEN_RE.findall(term)
+
+
+class IcontainsBackend:
+    """Case-insensitive substring match across SEARCH_FIELDS; no index support."""
+
+    def filter(self, queryset, term, ranked=False):
+        query = Q()
+        for field in SEARCH_FIELDS:
+            query |= Q(**{f'{field}__icontains': term})
+        return queryset.filter(query)
+
+
+class SqliteFTSBackend:
+    """SQLite FTS5 prefix search, ranked by bm25."""
+
+    def filter(self, queryset, term, ranked=False):
+        tokens = _tokens(term)
+        if not tokens:
+            return IcontainsBackend().filter(queryset, term)
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        table = queryset.model._meta.db_table
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        )
+        if ranked:
+            # bm25() is lower for better matches
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f'(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+                (match,), output_field=FloatField(),
+            )).order_by(F('search_rank').desc(nulls_last=True), '-updated_at', '-id')
+        return queryset
+
+
+class PostgresBackend:
+    """tsvector prefix search OR trigram-indexed substring match, ranked by ts_rank."""
+
+    def filter(self, queryset, term, ranked=False):
+        tokens = _tokens(term)
+        document = PG_DOCUMENT_SQL.format(t=f'"{queryset.model._meta.db_table}".')
+        vector = f"to_tsvector('simple', {document})"
+        like = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        if tokens:
+            tsquery = ' & '.join(f'{token}:*' for token in tokens)
+            where = f"({vector} @@ to_tsquery('simple', %s) OR {document} ILIKE %s)"
+            params = [tsquery, like]
+        else:
+            where = f'{document} ILIKE %s'
+            params = [like]
+        queryset = queryset.alias(
+            search_match=RawSQL(where, params, output_field=BooleanField()),
+        ).filter(search_match=True)
+        if ranked and tokens:
+            # float8 so the rank survives a round trip through a pagination cursor exactly
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f"ts_rank({vector}, to_tsquery('simple', %s))::float8", (tsquery,), output_field=FloatField(),
+            )).order_by('-search_rank', '-updated_at', '-id')
+        return queryset
+
+
+BACKENDS = {
+    'icontains': IcontainsBackend,
+    'sqlite_fts': SqliteFTSBackend,
+    'postgres': PostgresBackend,
+}
+
+_auto_backends = {}
+
+
+def _fts_table_exists(connection):
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def _pg_index_exists(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'lead_search_tsv_idx'")
+        return cursor.fetchone() is not None
+
+
+def _sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def _sqlite_fts_installed(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+            "OR (type = 'trigger' AND name IN (%s, %s, %s))",
+            [FTS_TABLE, f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'],
+        )
+        return cursor.fetchone()[0] == 4
+
+
+def install_search_index(schema_editor, force=False):
+    """
+    Create (or repair) the search index for the schema editor's database.
+    Idempotent, and a no-op when the index is intact unless ``force`` is
+    given.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and _sqlite_has_fts5(connection):
+        if not force and _sqlite_fts_installed(connection):
+            return
+        statements = SQLITE_INSTALL_SQL
+    elif connection.vendor == 'postgresql':
+        statements = PG_INSTALL_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+    _auto_backends.pop(connection.alias, None)
+
+
+def ensure_search_index(using='default'):
+    """Install the search index on ``using``, or repair it if a table rebuild dropped its triggers."""
+    from .models import Lead
+    connection = connections[using]
+    if not router.allow_migrate_model(using, Lead):
+        return
+    with connection.cursor() as cursor:
+        if Lead._meta.db_table not in connection.introspection.table_names(cursor):
+            return
+    with connection.schema_editor() as schema_editor:
+        install_search_index(schema_editor)
+
+
+def uninstall_search_index(schema_editor):
+    connection = schema_editor.connection
+    statements = {'sqlite': SQLITE_UNINSTALL_SQL, 'postgresql': PG_UNINSTALL_SQL}.get(connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+    _auto_backends.pop(connection.alias, None)
+
+
+def get_backend(using='default'):
+    """Return the search backend configured for the database alias ``using``."""
+    name = getattr(settings, 'LEADS_SEARCH_BACKEND', 'auto')
+    if name != 'auto':
+        return BACKENDS[name]()
+    if using not in _auto_backends:
+        connection = connections[using]
+        if connection.vendor == 'sqlite' and _fts_table_exists(connection):
+            _auto_backends[using] = SqliteFTSBackend()
+        elif connection.vendor == 'postgresql' and _pg_index_exists(connection):
+            _auto_backends[using] = PostgresBackend()
+        else:
+            _auto_backends[using] = IcontainsBackend()
+    return _auto_backends[using]
+
+
+def search_leads(queryset, term, ranked=False):
+    """
+    Filter ``queryset`` to leads matching ``term``. With ``ranked``, backends
+    that can rank (sqlite_fts, postgres) annotate search_rank and order by it.
+    A term that looks like a phone number also matches leads whose
+    normalised number ends with it, so "+234 803 123 4567" finds
+    "0803 123 4567"; such results are not ranked.
+    """
+    term = (term or '').strip()
+    if not term:
+        return queryset
+    backend = get_backend(queryset.db)
+    if looks_like_phone(term):
+        text_matches = backend.filter(queryset.model._default_manager.using(queryset.db), term)
+        return queryset.filter(Q(pk__in=text_matches.values('pk')) | phone_match(term))
+    return backend.filter(queryset, term, ranked=ranked)
@@ -3,202 +3,559 @@ Services for lead import/export functionality.
 """
 import csv
 import io
+import tempfile
 
 try:
-    from openpyxl import load_workbook, Workbook
+    from openpyxl import Workbook
     HAS_OPENPYXL = True
 except ImportError:
     HAS_OPENPYXL = False
 
+from django.db import DatabaseError, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .counters import apply_changes, batched_changes, lead_state
+from .dedup import (
+    DUPLICATES_ALLOW, DUPLICATES_SKIP, DUPLICATES_UPDATE, DUPLICATES_FLAG, DuplicateIndex, lead_keys,
+)
 from .models import Lead
+from .readers import UnsupportedFileError, iter_rows
 
 
 def _normalize_col(s):
     return str(s).strip().lower().replace(' ', '_') if s else ''
 
 
-def import_leads_from_file(file, user=None):
-    from django.contrib.auth.models import User
+COLUMN_MAP = {
+    'first_name': ['first_name', 'firstname', 'given_name'],
+    'last_name': ['last_name', 'lastname', 'surname', 'family_name'],
+    'prospect_name': ['prospect_name', 'name', 'full_name', 'contact_name', 'customer_name'],
+    'phone_number': ['phone_number', 'phone', 'tel', 'mobile', 'contact'],
+    'email': ['email', 'e-mail', 'mail'],
+    'point_of_contact': ['point_of_contact', 'contact_point', 'poc', 'referral'],
+    'prospect_response': ['prospect_response', 'response', 'feedback'],
+    'remarks': ['remarks', 'notes', 'comments'],
+    'status': ['status'],
+    'source': ['source', 'lead_source'],
+    'color_code': ['color_code', 'color'],
+    'assigned_to': ['assigned_to', 'assigned_staff', 'staff', 'assigned'],
+}
+
+VALID_STATUSES = frozenset(s[0] for s in Lead.STATUS_CHOICES)
+VALID_COLORS = frozenset(c[0] for c in Lead.COLOR_CHOICES if c[0])
+
+
+def _find_columns(headers):
+    """Map each logical column in COLUMN_MAP to its index in ``headers`` (or None)."""
+    columns = {}
+    for key, possible_names in COLUMN_MAP.items():
+        columns[key] = next((headers.index(name) for name in possible_names if name in headers), None)
+    return columns
+
+
+def _get_val(row, idx):
+    if idx is not None and idx < len(row):
+        v = row[idx]
+        return str(v).strip() if v is not None else ''
+    return ''
+
+
+def _clean_row(row, columns):
+    """
+    Normalise one data row into a dict of Lead field values.
+    Raises ValueError with a user-facing message if the row must be skipped.
+    """
+    if columns['first_name'] is not None:
+        first_name = _get_val(row, columns['first_name'])
+        last_name = _get_val(row, columns['last_name'])
+    else:
+        full = _get_val(row, columns['prospect_name'])
+        parts = full.split(None, 1)
+        first_name = parts[0][:100] if parts else ''
+        last_name = (parts[1][:100] if len(parts) > 1 else '')
+    if not first_name:
+        raise ValueError('Missing first name, skipped')
+
+    status_val = _get_val(row, columns['status']).lower()
+    color_val = _get_val(row, columns['color_code'])
+
+    return {
+        'first_name': first_name[:100],
+        'last_name': last_name[:100],
+        'phone_number': _get_val(row, columns['phone_number'])[:50],
+        'email': _get_val(row, columns['email'])[:254],
+        'point_of_contact': _get_val(row, columns['point_of_contact'])[:200],
+        'prospect_response': _get_val(row, columns['prospect_response']),
+        'remarks': _get_val(row, columns['remarks']),
+        'source': _get_val(row, columns['source'])[:100],
+        'status': status_val if status_val in VALID_STATUSES else 'new',
+        'color_code': color_val if color_val in VALID_COLORS else '',
+    }
+
+
+def _iter_cleaned(rows, columns):
+    """Yield (row_number, fields or None, staff_name, error or None) for each data row; the header is row 1."""
+    for row_number, row in enumerate(rows, start=2):
+        try:
+            yield row_number, _clean_row(row, columns), _get_val(row, columns['assigned_to']), None
+        except Exception as e:
+            yield row_number, None, '', str(e)
+
+
+class _StaffResolver:
+    """
+    Case-insensitive username -> user id lookup for imports.
+    Names are resolved with one query per batch of not-yet-seen names and
+    cached (including misses) for the rest of the file.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._unknown_seen = set()
+        self.unknown = []
+
+    def resolve(self, names):
+        from django.contrib.auth.models import User
+        missing = {name.lower() for name in names} - self._ids.keys()
+        if not missing:
+            return
+        self._ids.update(dict.fromkeys(missing))
+        # Oldest account wins if usernames differ only by case
+        self._ids.update(
+            User.objects.annotate(username_lower=Lower('username')).filter(
+                username_lower__in=missing
+            ).order_by('-id').values_list('username_lower', 'id')
+        )
+
+    def assign(self, lead, name):
+        user_id = self._ids.get(name.lower())
+        if user_id is None:
+            if name.lower() not in self._unknown_seen:
+                self._unknown_seen.add(name.lower())
+                self.unknown.append(name)
+        else:
+            lead.assigned_to_id = user_id
+
+
+def _write_batch(batch, errors):
+    """
+    Insert a batch of (row_number, Lead) pairs with one bulk_create in a
+    transaction. If the batch fails, fall back to saving its rows one by
+    one in savepoints so a single bad row does not lose the whole batch.
+    Returns the number of leads written.
+    """
+    if not batch:
+        return 0
+    try:
+        with transaction.atomic():
+            Lead.objects.bulk_create([lead for _, lead in batch])
+            apply_changes(added=[lead_state(lead) for _, lead in batch])
+        return len(batch)
+    except DatabaseError:
+        pass
+
+    written = 0
+    with transaction.atomic(), batched_changes():
+        for row_number, lead in batch:
+            lead.pk = None
+            try:
+                with transaction.atomic():
+                    lead.save()
+                written += 1
+            except DatabaseError as e:
+                errors.append(f"Row {row_number}: {str(e)}")
+    return written
+
+
+# Lead fields an import can overwrite when merging into a duplicate, by source column
+_MERGE_FIELDS = {
+    'first_name': ('first_name', 'prospect_name'),
+    'last_name': ('last_name', 'prospect_name'),
+    'phone_number': ('phone_number',),
+    'email': ('email',),
+    'point_of_contact': ('point_of_contact',),
+    'prospect_response': ('prospect_response',),
+    'remarks': ('remarks',),
+    'status': ('status',),
+    'source': ('source',),
+    'color_code': ('color_code',),
+}
+
+
+class _ImportRun:
+    """State for one import: pending rows, staff lookups and duplicate handling."""
+
+    def __init__(self, columns, user, duplicates, errors):
+        self.columns = columns
+        self.user = user
+        self.duplicates = duplicates
+        self.errors = errors
+        self.staff = _StaffResolver()
+        # (row_number, Lead) read since the last flush
+        self.rows = []
+        self.batch = []
+        self.updates = {}
+        self.flagged = []
+        self.duplicate_rows = []
+        self.success_count = 0
+        self.merge_fields = [
+            field for field, sources in _MERGE_FIELDS.items()
+            if any(columns[source] is not None for source in sources)
+        ]
+        if columns['assigned_to'] is not None:
+            self.merge_fields.append('assigned_to')
+        self.index = None
+        if duplicates != DUPLICATES_ALLOW:
+            self.index = DuplicateIndex()
+
+    def add(self, row_number, lead, staff_name):
+        lead._import_staff = staff_name
+        self.rows.append((row_number, lead))
+
+    def _place(self, row_number, lead):
+        """Queue a row for insert, or skip, merge or flag it if it duplicates a lead."""
+        if self.index is not None:
+            match = self.index.find(lead._dedup_keys)
+            if match is not None:
+                target, kind = match
+                self.duplicate_rows.append(row_number)
+                if self.duplicates == DUPLICATES_SKIP:
+                    return
+                if self.duplicates == DUPLICATES_UPDATE:
+                    self._merge(target, lead)
+                    return
+                self.flagged.append((lead, target))
+            self.index.add(lead._dedup_keys, lead)
+        self.batch.append((row_number, lead))
+
+    def _merge(self, target, lead):
+        if isinstance(target, Lead) and target.pk is None:
+            # Duplicate of a row still waiting in this batch
+            self._copy_non_empty(lead, target)
+            return
+        pk = target.pk if isinstance(target, Lead) else target
+        self.updates.setdefault(pk, []).append(lead)
+
+    def _copy_non_empty(self, source, target):
+        for field in self.merge_fields:
+            if field == 'assigned_to':
+                if source._import_staff:
+                    target._import_staff = source._import_staff
+            elif getattr(source, field):
+                setattr(target, field, getattr(source, field))
+        target.refresh_phone_digits()
+
+    def flush(self):
+        if self.index is not None:
+            for _, lead in self.rows:
+                lead._dedup_keys = lead_keys(lead)
+            self.index.load(Lead.objects.all(), [key for _, lead in self.rows for key in lead._dedup_keys])
+        for row_number, lead in self.rows:
+            self._place(row_number, lead)
+        self.rows = []
+
+        pending = [lead for _, lead in self.batch] + [
+            lead for leads in self.updates.values() for lead in leads
+        ]
+        self.staff.resolve([lead._import_staff for lead in pending if lead._import_staff])
+        for lead in pending:
+            if lead._import_staff:
+                self.staff.assign(lead, lead._import_staff)
+
+        # Rows merged into existing leads are reported by summary(), not counted as imported
+        self.success_count += _write_batch(self.batch, self.errors)
+        self._write_updates()
+        self._write_flags()
+        if self.index is not None:
+            for _, lead in self.batch:
+                if lead.pk is not None:
+                    self.index.replace(lead._dedup_keys, lead, lead.pk)
+                else:
+                    # Its insert failed, so later rows are not duplicates of it
+                    self.index.discard(lead._dedup_keys, lead)
+        self.batch = []
+
+    def _write_updates(self):
+        if not self.updates:
+            return
+        now = timezone.now()
+        fields = [f if f != 'assigned_to' else 'assigned_to_id' for f in self.merge_fields]
+        existing = list(Lead.objects.filter(pk__in=self.updates.keys()))
+        before = [lead_state(target) for target in existing]
+        for target in existing:
+            for lead in self.updates[target.pk]:
+                self._copy_non_empty(lead, target)
+                if 'assigned_to' in self.merge_fields and lead.assigned_to_id:
+                    target.assigned_to_id = lead.assigned_to_id
+            target.updated_at = now
+        with transaction.atomic():
+            Lead.objects.bulk_update(
+                existing, fields + ['phone_digits', 'phone_digits_reversed', 'updated_at'],
+            )
+            apply_changes(added=[lead_state(target) for target in existing], removed=before)
+        self.updates = {}
+
+    def _write_flags(self):
+        flagged = []
+        for lead, target in self.flagged:
+            target_pk = target.pk if isinstance(target, Lead) else target
+            if lead.pk is not None and target_pk is not None:
+                lead.duplicate_of_id = target_pk
+                flagged.append(lead)
+        if flagged:
+            Lead.objects.bulk_update(flagged, ['duplicate_of'])
+        self.flagged = []
+
+    def summary(self):
+        if not self.duplicate_rows:
+            return None
+        action = {
+            DUPLICATES_SKIP: 'skipped',
+            DUPLICATES_UPDATE: 'merged into existing leads',
+            DUPLICATES_FLAG: 'imported and flagged',
+        }[self.duplicates]
+        shown = ', '.join(str(n) for n in self.duplicate_rows[:50])
+        more = f' and {len(self.duplicate_rows) - 50} more' if len(self.duplicate_rows) > 50 else ''
+        return f'{len(self.duplicate_rows)} duplicate row(s) {action}: rows {shown}{more}.'
+
+
+def _flush(run, progress, rows_processed):
+    """Write the pending batch and report progress in one transaction, so a resumed import skips exactly what was written."""
+    with transaction.atomic():
+        run.flush()
+        if progress:
+            progress(rows_processed, run.success_count)
+
+
+def import_leads_from_file(file, user=None, batch_size=None, progress=None,
+                           duplicates=DUPLICATES_ALLOW, skip_rows=0):
     """
     Import leads from CSV or Excel file.
     Expected columns: first_name, last_name (or prospect_name/name for legacy),
                      phone_number, email, point_of_contact, etc.
+    Rows are inserted with bulk_create in batches of ``batch_size``
+    (LEADS_IMPORT_BATCH_SIZE by default), one transaction per batch.
+    ``progress``, if given, is called as progress(rows_processed, success_count)
+    inside each batch's transaction, after its leads are written. The first
+    ``skip_rows`` data rows (committed by an earlier, interrupted run) are
+    checked for errors again but not imported.
+    ``duplicates`` is one of the leads.dedup policies; rows matching an
+    existing lead (or an earlier row) by phone, email or name are skipped,
+    merged into that lead, or imported with duplicate_of set. Only inserted
+    rows count towards success_count; skipped and merged rows are reported
+    in a summary message.
     Returns (success_count, error_messages).
     """
+    from django.conf import settings
+    batch_size = batch_size or settings.LEADS_IMPORT_BATCH_SIZE
     errors = []
-    success_count = 0
+    run = None
 
     try:
-        filename = file.name.lower()
-        rows = []
-
-        if filename.endswith('.csv'):
-            content = file.read().decode('utf-8-sig')
-            reader = csv.reader(io.StringIO(content))
-            rows = list(reader)
-            if not rows:
-                return 0, ['File is empty.']
-            headers = [_normalize_col(h) for h in rows[0]]
-            data_rows = rows[1:]
-        elif filename.endswith(('.xlsx', '.xls')):
-            if not HAS_OPENPYXL:
-                return 0, ['Excel support requires openpyxl. Run: pip install openpyxl']
-            wb = load_workbook(filename=file, read_only=True)
-            ws = wb.active
-            rows_list = list(ws.iter_rows(values_only=True))
-            wb.close()
-            if not rows_list:
-                return 0, ['File is empty.']
-            headers = [_normalize_col(h) for h in rows_list[0]]
-            data_rows = [list(r) for r in rows_list[1:]]
-        else:
-            return 0, ['Unsupported file format. Use CSV or Excel.']
-
-        column_map = {
-            'first_name': ['first_name', 'firstname', 'given_name'],
-            'last_name': ['last_name', 'lastname', 'surname', 'family_name'],
-            'prospect_name': ['prospect_name', 'name', 'full_name', 'contact_name', 'customer_name'],
-            'phone_number': ['phone_number', 'phone', 'tel', 'mobile', 'contact'],
-            'email': ['email', 'e-mail', 'mail'],
-            'point_of_contact': ['point_of_contact', 'contact_point', 'poc', 'referral'],
-            'prospect_response': ['prospect_response', 'response', 'feedback'],
-            'remarks': ['remarks', 'notes', 'comments'],
-            'status': ['status'],
-            'source': ['source', 'lead_source'],
-            'color_code': ['color_code', 'color'],
-            'assigned_to': ['assigned_to', 'assigned_staff', 'staff', 'assigned'],
-        }
-
-        def find_col(possible_names):
-            for name in possible_names:
-                if name in headers:
-                    return headers.index(name)
-            return None
+        try:
+            rows = iter_rows(file)
+            header = next(rows, None)
+        except UnsupportedFileError as e:
+            return 0, [str(e)]
+        if header is None:
+            return 0, ['File is empty.']
+        headers = [_normalize_col(h) for h in header]
 
-        col_first = find_col(column_map['first_name'])
-        col_last = find_col(column_map['last_name'])
-        col_prospect = find_col(column_map['prospect_name'])
-        if col_first is None and col_prospect is None:
+        columns = _find_columns(headers)
+        if columns['first_name'] is None and columns['prospect_name'] is None:
             return 0, ['Required: "first_name" or "prospect_name"/"name" not found.']
 
-        col_phone = find_col(column_map['phone_number'])
-        col_email = find_col(column_map['email'])
-        col_poc = find_col(column_map['point_of_contact'])
-        col_response = find_col(column_map['prospect_response'])
-        col_remarks = find_col(column_map['remarks'])
-        col_status = find_col(column_map['status'])
-        col_source = find_col(column_map['source'])
-        col_color = find_col(column_map['color_code'])
-        col_assigned = find_col(column_map['assigned_to'])
-
-        def get_val(row, idx):
-            if idx is not None and idx < len(row):
-                v = row[idx]
-                return str(v).strip() if v is not None else ''
-            return ''
-
-        valid_statuses = [s[0] for s in Lead.STATUS_CHOICES]
-        valid_colors = [c[0] for c in Lead.COLOR_CHOICES if c[0]]
-
-        for i, row in enumerate(data_rows):
-            try:
-                if col_first is not None:
-                    first_name = get_val(row, col_first)
-                    last_name = get_val(row, col_last) if col_last is not None else ''
-                else:
-                    full = get_val(row, col_prospect)
-                    parts = full.split(None, 1)
-                    first_name = parts[0][:100] if parts else ''
-                    last_name = (parts[1][:100] if len(parts) > 1 else '')
-                if not first_name:
-                    errors.append(f"Row {i + 2}: Missing first name, skipped")
-                    continue
-
-                status_val = get_val(row, col_status)
-                status = status_val.lower() if status_val.lower() in valid_statuses else 'new'
-
-                color_val = get_val(row, col_color)
-                color_code = color_val if color_val in valid_colors else ''
-
-                assigned_to = None
-                if col_assigned is not None:
-                    staff_val = get_val(row, col_assigned)
-                    if staff_val:
-                        try:
-                            assigned_to = User.objects.get(username__iexact=staff_val)
-                        except User.DoesNotExist:
-                            pass
-
-                lead = Lead(
-                    first_name=first_name[:100],
-                    last_name=last_name[:100],
-                    phone_number=get_val(row, col_phone)[:50],
-                    email=get_val(row, col_email)[:254],
-                    point_of_contact=get_val(row, col_poc)[:200],
-                    prospect_response=get_val(row, col_response),
-                    remarks=get_val(row, col_remarks),
-                    source=get_val(row, col_source)[:100],
-                    status=status,
-                    color_code=color_code,
-                    assigned_to=assigned_to,
-                    created_by=user,
-                )
-                lead.save()
-                success_count += 1
-            except Exception as e:
-                errors.append(f"Row {i + 2}: {str(e)}")
+        run = _ImportRun(columns, user, duplicates, errors)
+        rows_processed = 0
+        for row_number, fields, staff_name, error in _iter_cleaned(rows, columns):
+            rows_processed = row_number - 1
+            if error is not None:
+                errors.append(f"Row {row_number}: {error}")
+                continue
+            if rows_processed <= skip_rows:
+                continue
+            lead = Lead(created_by=user, **fields)
+            lead.refresh_phone_digits()
+            run.add(row_number, lead, staff_name)
+            if len(run.rows) >= batch_size:
+                _flush(run, progress, rows_processed)
+        _flush(run, progress, rows_processed)
+
+        summary = run.summary()
+        if summary:
+            errors.append(summary)
+        if run.staff.unknown:
+            errors.append(
+                'Unknown staff username(s), leads left unassigned: ' + ', '.join(run.staff.unknown)
+            )
 
     except Exception as e:
         errors.append(f"File processing error: {str(e)}")
 
-    return success_count, errors
-
-
-def export_leads_to_csv(queryset):
-    """Export leads to CSV format."""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        'First Name', 'Last Name', 'Phone Number', 'Email', 'Point of Contact',
-        'Prospect Response', 'Remarks', 'Status', 'Color Code', 'Source',
-        'Assigned To', 'Created At', 'Updated At'
-    ])
-    for lead in queryset:
-        writer.writerow([
-            lead.first_name, lead.last_name, lead.phone_number, lead.email,
-            lead.point_of_contact, lead.prospect_response, lead.remarks,
-            lead.status, lead.color_code, lead.source,
-            lead.assigned_to.username if lead.assigned_to else '',
-            lead.created_at.strftime('%Y-%m-%d %H:%M'),
-            lead.updated_at.strftime('%Y-%m-%d %H:%M'),
-        ])
-    return output.getvalue()
+    return (run.success_count if run else 0), errors
 
 
-def export_leads_to_excel(queryset):
-    """Export leads to Excel format. Requires openpyxl."""
+EXPORT_HEADERS = [
+    'First Name', 'Last Name', 'Phone Number', 'Email', 'Point of Contact',
+    'Prospect Response', 'Remarks', 'Status', 'Color Code', 'Source',
+    'Assigned To', 'Created At', 'Updated At'
+]
+# values_list() columns matching EXPORT_HEADERS
+CSV_EXPORT_COLUMNS = (
+    'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact',
+    'prospect_response', 'remarks', 'status', 'color_code', 'source',
+    'assigned_to__username', 'created_at', 'updated_at',
+)
+# Rows joined into one chunk of the streamed response
+CSV_ROWS_PER_WRITE = 256
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_leads_csv(queryset, chunk_size=None):
+    """
+    Yield the CSV export of ``queryset`` in text chunks.
+    Rows are read as tuples through a chunked iterator, so memory stays
+    constant however many leads are exported.
+    """
+    from django.conf import settings
+    chunk_size = chunk_size or settings.LEADS_EXPORT_CHUNK_SIZE
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    rows = queryset.values_list(*CSV_EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    buffer = []
+    for *fields, staff, created_at, updated_at in rows:
+        buffer.append(writer.writerow([
+            *fields, staff or '',
+            created_at.strftime('%Y-%m-%d %H:%M'),
+            updated_at.strftime('%Y-%m-%d %H:%M'),
+        ]))
+        if len(buffer) >= CSV_ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+# Incremental exports add the lead id and a deleted flag, with full-precision timestamps
+DELTA_EXPORT_HEADERS = ['ID', *EXPORT_HEADERS, 'Deleted']
+
+
+def iter_lead_changes_csv(queryset, since, until, chunk_size=None, unfiltered=None):
+    """
+    Yield the incremental CSV export of leads in ``queryset`` changed
+    between the ``since`` and ``until`` watermarks, in change order, with a
+    row per deleted lead (ID, Updated At = deletion time, Deleted = yes).
+    With ``unfiltered`` (the leads ``queryset`` was filtered from), changed
+    leads no longer matching the filters get the same row with
+    Deleted = filtered.
+    """
+    from django.conf import settings
+    from .delta import DELETED, FILTERED_OUT, iter_changes
+    chunk_size = chunk_size or settings.LEADS_EXPORT_CHUNK_SIZE
+    writer = csv.writer(_Echo())
+    yield writer.writerow(DELTA_EXPORT_HEADERS)
+    blank = [''] * (len(EXPORT_HEADERS) - 1)
+    removed = {DELETED: 'yes', FILTERED_OUT: 'filtered'}
+    buffer = []
+    for timestamp, pk, row in iter_changes(queryset, CSV_EXPORT_COLUMNS, since, until, chunk_size, unfiltered):
+        if row in removed:
+            line = [pk, *blank, timestamp.isoformat(), removed[row]]
+        else:
+            *fields, staff, created_at, updated_at = row
+            line = [pk, *fields, staff or '', created_at.isoformat(), updated_at.isoformat(), '']
+        buffer.append(writer.writerow(line))
+        if len(buffer) >= CSV_ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_leads_to_csv(queryset, since=None, until=None, unfiltered=None):
+    """
+    Export leads to CSV format. With a ``since`` watermark, export only the
+    changes after it (see iter_lead_changes_csv); ``until`` defaults to
+    leads.delta.next_watermark(since).
+    """
+    if since is None:
+        return ''.join(iter_leads_csv(queryset))
+    if until is None:
+        from .delta import next_watermark
+        until = next_watermark(since)
+    return ''.join(iter_lead_changes_csv(queryset, since, until, unfiltered=unfiltered))
+
+
+# Excel's row limit per worksheet, header row included
+XLSX_MAX_ROWS = 1048576
+
+
+def write_leads_to_excel(queryset, fileobj, chunk_size=None, max_rows=XLSX_MAX_ROWS):
+    """
+    Write the Excel export of ``queryset`` to ``fileobj`` using a write-only
+    workbook. Rows are read through a chunked iterator and choice labels come
+    from a lookup table, so memory stays flat. A new sheet ("Leads 2", ...)
+    is started whenever a sheet reaches ``max_rows``.
+    """
     if not HAS_OPENPYXL:
         raise ImportError('Excel export requires openpyxl. Run: pip install openpyxl')
-    wb = Workbook()
-    ws = wb.active
-    ws.title = 'Leads'
-    headers = [
-        'First Name', 'Last Name', 'Phone Number', 'Email', 'Point of Contact',
-        'Prospect Response', 'Remarks', 'Status', 'Color Code', 'Source',
-        'Assigned To', 'Created At', 'Updated At'
-    ]
-    ws.append(headers)
-    for lead in queryset:
+    from django.conf import settings
+    chunk_size = chunk_size or settings.LEADS_EXPORT_CHUNK_SIZE
+    status_labels = dict(Lead.STATUS_CHOICES)
+    color_labels = dict(Lead.COLOR_CHOICES)
+
+    wb = Workbook(write_only=True)
+
+    def new_sheet():
+        title = 'Leads' if not wb.worksheets else f'Leads {len(wb.worksheets) + 1}'
+        sheet = wb.create_sheet(title)
+        sheet.append(EXPORT_HEADERS)
+        return sheet
+
+    ws = new_sheet()
+    sheet_rows = 1
+    rows = queryset.values_list(*CSV_EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    for (first_name, last_name, phone_number, email, point_of_contact, prospect_response,
+         remarks, status, color_code, source, staff, created_at, updated_at) in rows:
+        if sheet_rows >= max_rows:
+            ws = new_sheet()
+            sheet_rows = 1
         ws.append([
-            lead.first_name, lead.last_name, lead.phone_number, lead.email,
-            lead.point_of_contact, lead.prospect_response, lead.remarks,
-            lead.get_status_display(), lead.get_color_code_display() or '',
-            lead.source,
-            lead.assigned_to.username if lead.assigned_to else '',
-            lead.created_at.strftime('%Y-%m-%d %H:%M'),
-            lead.updated_at.strftime('%Y-%m-%d %H:%M'),
+            first_name, last_name, phone_number, email,
+            point_of_contact, prospect_response, remarks,
+            status_labels.get(status, status), color_labels.get(color_code, color_code) or '',
+            source,
+            staff or '',
+            created_at.strftime('%Y-%m-%d %H:%M'),
+            updated_at.strftime('%Y-%m-%d %H:%M'),
         ])
+        sheet_rows += 1
+    wb.save(fileobj)
+
+
+def spool_leads_to_excel(queryset, chunk_size=None):
+    """
+    Write the Excel export to an anonymous temp file and return it rewound,
+    ready to be streamed back. The caller owns (and must close) the file.
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+        write_leads_to_excel(queryset, spool, chunk_size=chunk_size)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def export_leads_to_excel(queryset):
+    """Export leads to Excel format. Requires openpyxl."""
     output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    write_leads_to_excel(queryset, output)
     return output.getvalue()
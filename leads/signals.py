@@ -0,0 +1,83 @@
+"""
+Keep leads.counters current for single-lead saves and deletes, record
+tombstones for deleted leads (see leads.delta), and invalidate cached user
+choices when users change.
+
+Bulk writes (bulk_create, bulk_update, queryset.update) send no per-row
+signals and call leads.counters.apply_changes themselves. Deletes batch the
+per-row work with leads.counters.batched_changes and
+leads.delta.batched_tombstones.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import USERS, invalidate
+from . import delta
+from .counters import apply_changes, lead_state, reassign_staff
+from .models import COUNTED_FIELDS, Lead
+
+
+def _written(field, update_fields):
+    return update_fields is None or field in update_fields or field.removesuffix('_id') in update_fields
+
+
+@receiver(pre_save, sender=Lead)
+def remember_counted_state(sender, instance, update_fields=None, **kwargs):
+    """
+    The counted state an update replaces: as the lead was loaded or last
+    saved, or read back for a lead that was built by hand or loaded
+    without those fields.
+    """
+    instance._counter_state = None
+    if instance.pk is None:
+        return
+    if not any(_written(field, update_fields) for field in COUNTED_FIELDS):
+        return
+    state = getattr(instance, '_saved_counted_state', None)
+    if state is None:
+        state = sender._base_manager.filter(pk=instance.pk).values_list(*COUNTED_FIELDS).first()
+    if state is not None:
+        instance._counter_state = (state[0], state[1] or '', state[2])
+
+
+@receiver(post_save, sender=Lead)
+def count_saved_lead(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        after = lead_state(instance)
+        apply_changes(added=[after])
+    else:
+        before = getattr(instance, '_counter_state', None)
+        if before is None:
+            return
+        # Counted fields left out of update_fields keep their stored values
+        after = tuple(
+            new if _written(field, update_fields) else old
+            for field, new, old in zip(COUNTED_FIELDS, lead_state(instance), before)
+        )
+        apply_changes(added=[after], removed=[before])
+    instance._saved_counted_state = after
+
+
+@receiver(post_delete, sender=Lead)
+def count_deleted_lead(sender, instance, **kwargs):
+    apply_changes(removed=[lead_state(instance)])
+
+
+@receiver(post_delete, sender=Lead)
+def record_tombstone(sender, instance, **kwargs):
+    delta.record_tombstone(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_staff(sender, instance, **kwargs):
+    reassign_staff(instance.pk)
+    invalidate(USERS)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_choices(sender, instance, update_fields=None, **kwargs):
+    # Logging in saves last_login, which nothing cached depends on
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate(USERS)
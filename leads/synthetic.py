@@ -0,0 +1,143 @@
+"""
+Synthetic lead data for benchmarks and load testing, and the scratch
+database the benchmarks seed it into.
+"""
+import csv
+import os
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection, connections
+
+from .counters import apply_changes, lead_state
+from .models import Lead
+
+FIRST_NAMES = [
+    'Chinedu', 'Amaka', 'Tunde', 'Ngozi', 'Emeka', 'Funmi', 'Ibrahim', 'Aisha',
+    'Segun', 'Kemi', 'Obinna', 'Zainab', 'Femi', 'Bisi', 'Uche', 'Halima',
+]
+LAST_NAMES = [
+    'Okafor', 'Adeyemi', 'Balogun', 'Eze', 'Nwosu', 'Bello', 'Okonkwo', 'Abubakar',
+    'Afolabi', 'Obi', 'Lawal', 'Ogunleye', 'Musa', 'Chukwu', 'Olawale', 'Danjuma',
+]
+POINTS_OF_CONTACT = ['Website', 'Instagram', 'Facebook', 'Walk-in', 'Referral', 'Billboard', 'Radio']
+RESPONSES = [
+    'Interested in a 3-bedroom flat in Lekki.',
+    'Wants to inspect the property next weekend.',
+    'Asked for payment plan options.',
+    'Not interested at the moment, call back in three months.',
+    'Requested brochure and floor plans by email.',
+]
+REMARKS = [
+    'Called twice, no answer.',
+    'Prefers WhatsApp.',
+    'Budget around 45m naira.',
+    'Spoke with spouse, decision pending.',
+    '',
+]
+CSV_HEADER = [
+    'first_name', 'last_name', 'phone_number', 'email', 'point_of_contact',
+    'prospect_response', 'remarks', 'status', 'color_code', 'source', 'assigned_to',
+]
+
+
+def synthetic_rows(count, staff_names=(), seed=0):
+    """Yield ``count`` upload rows (lists in CSV_HEADER order)."""
+    rng = random.Random(seed)
+    statuses = [s[0] for s in Lead.STATUS_CHOICES]
+    colors = [c[0] for c in Lead.COLOR_CHOICES]
+    staff_names = list(staff_names) + ['']
+    for i in range(count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        yield [
+            first, last,
+            f'+234 80{rng.randint(0, 9)} {rng.randint(100, 999)} {rng.randint(1000, 9999)}',
+            f'{first.lower()}.{last.lower()}{i}@example.com',
+            rng.choice(POINTS_OF_CONTACT),
+            rng.choice(RESPONSES),
+            rng.choice(REMARKS),
+            rng.choice(statuses),
+            rng.choice(colors),
+            rng.choice(POINTS_OF_CONTACT),
+            rng.choice(staff_names),
+        ]
+
+
+def write_synthetic_csv(fileobj, count, staff_names=(), seed=0):
+    """Write a synthetic upload file with a header row to a text file object."""
+    writer = csv.writer(fileobj)
+    writer.writerow(CSV_HEADER)
+    writer.writerows(synthetic_rows(count, staff_names, seed))
+
+
+def write_synthetic_xlsx(fileobj, count, staff_names=(), seed=0):
+    """Write a synthetic upload workbook with a header row to a binary file object (needs openpyxl)."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Leads')
+    ws.append(CSV_HEADER)
+    for row in synthetic_rows(count, staff_names, seed):
+        ws.append(row)
+    wb.save(fileobj)
+
+
+def ensure_staff(count, prefix='bench_staff'):
+    """Return ``count`` staff users named ``<prefix>_<n>``, creating any that are missing."""
+    from django.contrib.auth.models import User
+    names = [f'{prefix}_{i}' for i in range(count)]
+    existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+    User.objects.bulk_create([User(username=name) for name in names if name not in existing])
+    return list(User.objects.filter(username__in=names).order_by('username'))
+
+
+def seed_leads(count, staff=(), seed=0, batch_size=2000):
+    """Insert ``count`` synthetic leads, spread across ``staff``. Returns the number inserted."""
+    staff_by_name = {u.username: u for u in staff}
+    batch = []
+    inserted = 0
+    for row in synthetic_rows(count, staff_by_name.keys(), seed):
+        fields = dict(zip(CSV_HEADER, row))
+        fields['assigned_to'] = staff_by_name.get(fields['assigned_to'])
+        lead = Lead(**fields)
+        lead.refresh_phone_digits()
+        batch.append(lead)
+        if len(batch) >= batch_size:
+            _insert(batch)
+            inserted += len(batch)
+            batch = []
+    _insert(batch)
+    return inserted + len(batch)
+
+
+def _insert(batch):
+    Lead.objects.bulk_create(batch)
+    apply_changes(added=[lead_state(lead) for lead in batch])
+
+
+@contextmanager
+def scratch_database():
+    """
+    Point the default database at a new, migrated scratch database for the
+    block and drop it afterwards, as the test runner does (test_<name> on
+    PostgreSQL). On SQLite it is a file in a temporary directory rather than
+    the test runner's in-memory database, so WAL and the page cache behave
+    as they do in production. Benchmarks seed and time it, so the live
+    database is never locked or changed.
+    """
+    scratch_dir = tempfile.mkdtemp() if connection.vendor == 'sqlite' else None
+    live_name = connection.settings_dict['NAME']
+    if scratch_dir:
+        connection.settings_dict['TEST']['NAME'] = os.path.join(scratch_dir, 'bench.sqlite3')
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(live_name, verbosity=0)
+    finally:
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
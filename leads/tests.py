@@ -0,0 +1,752 @@
+"""
+Tests for the leads app.
+
+    python manage.py test leads
+"""
+import csv
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import metrics, services
+from .budget_cases import BUDGET_SPARE_LEADS, CASES, BudgetContext, run_budget_case, uncovered_urls
+from .checks import check_shared_cache, check_sqlite_request_transactions
+from .bulk import ACTION_ASSIGN, ACTION_DELETE, ACTION_STATUS, apply_bulk_action
+from .counters import count_leads, stored_counts
+from .dedup import DUPLICATES_FLAG, DUPLICATES_SKIP, DUPLICATES_UPDATE, merge_leads
+from .delta import Watermark, parse_watermark
+from .jobs import claim_next_job, run_import_job, waiting_for_worker
+from .models import ImportJob, Lead, LeadCounter, LeadTombstone
+from .search import FTS_TABLE, _sqlite_fts_installed, ensure_search_index
+from .services import import_leads_from_file
+from .synthetic import ensure_staff, seed_leads
+
+# Lead counts the query-count tests compare
+SMALL, LARGE = 20, 200
+# Tests clear and fill the cache, so they get their own instead of the configured (shared) one
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class LeadTestCase(TestCase):
+    """A logged-in staff user, a few assignable staff and an empty, test-only cache."""
+
+    password = 'test-pass-7Qx'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password=cls.password, is_staff=True, is_superuser=True)
+        cls.staff = ensure_staff(3, prefix='test_staff')
+
+    def setUp(self):
+        # Cache invalidation waits for commits that never happen inside TestCase
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def seed(self, size):
+        """Add synthetic leads until the table holds ``size``."""
+        seed_leads(size - Lead.objects.count(), self.staff, seed=Lead.objects.count())
+
+    def get(self, path, params=None):
+        """GET ``path``, reading a streamed body to the end so its queries run."""
+        response = self.client.get(path, params or {})
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+class QueryCountTests(LeadTestCase):
+    """Each page runs the same small number of queries however many leads there are."""
+
+    def assertConstantQueries(self, queries, path, params=None):
+        for size in (SMALL, LARGE):
+            with self.subTest(leads=size):
+                self.seed(size)
+                self.get(path, params)  # warm the cache
+                with self.assertNumQueries(queries):
+                    self.get(path, params)
+
+    def test_lead_list(self):
+        # session, user, page of leads (dashboard and staff choices are cached)
+        self.assertConstantQueries(3, reverse('leads:lead_list'))
+
+    def test_lead_list_filtered(self):
+        self.assertConstantQueries(3, reverse('leads:lead_list'), {'status': 'new', 'staff': self.staff[0].pk})
+
+    def test_lead_detail(self):
+        self.seed(SMALL)
+        lead = Lead.objects.order_by('pk').first()
+        self.assertConstantQueries(3, reverse('leads:lead_detail', args=[lead.pk]))
+
+    def test_lead_download_csv(self):
+        # session, user, one streamed query for every lead
+        self.assertConstantQueries(3, reverse('leads:lead_download'))
+
+    def test_lead_download_changes(self):
+        # plus the tombstones for the deletions
+        self.assertConstantQueries(4, reverse('leads:lead_download'), {'since': '1970-01-01T00:00:00Z,0'})
+
+    def test_lead_download_changes_filtered(self):
+        # changed leads flagged by whether they still match, in the same query
+        self.assertConstantQueries(
+            4, reverse('leads:lead_download'), {'since': '1970-01-01T00:00:00Z,0', 'status': 'new'},
+        )
+
+    def test_admin_changelist(self):
+        self.assertConstantQueries(6, reverse('admin:leads_lead_changelist'))
+
+    def test_admin_changelist_skips_long_text_columns(self):
+        self.seed(SMALL)
+        lead = Lead.objects.order_by('pk').first()
+        with CaptureQueriesContext(connection) as changelist:
+            self.get(reverse('admin:leads_lead_changelist'), {'q': lead.first_name})
+        # remarks is searched, so it may appear after FROM, but is not selected
+        selected = [
+            query['sql'].split(' FROM ')[0] for query in changelist
+            if query['sql'].startswith('SELECT "leads_lead"."id"')
+        ]
+        self.assertTrue(selected)
+        for columns in selected:
+            self.assertNotIn('"leads_lead"."prospect_response"', columns)
+            self.assertNotIn('"leads_lead"."remarks"', columns)
+            self.assertIn('"auth_user"."username"', columns)
+        with CaptureQueriesContext(connection) as change:
+            self.get(reverse('admin:leads_lead_change', args=[lead.pk]))
+        self.assertTrue(any('"leads_lead"."prospect_response"' in query['sql'] for query in change))
+
+
+class QueryBudgetTests(LeadTestCase):
+    """
+    Every lead URL stays within its view's query budget (see leads.budgets)
+    and runs no more queries at LARGE leads than at BUDGET_SPARE_LEADS.
+    `manage.py check_query_budgets` runs the same leads.budget_cases.CASES on
+    a real database.
+    """
+
+    def test_views_stay_within_their_budgets(self):
+        job = ImportJob.objects.create(original_name='budget.csv', file='imports/budget.csv', created_by=self.user)
+        ctx = BudgetContext(self.user, self.password, self.staff, job)
+        counts = {}
+        for size in (BUDGET_SPARE_LEADS, LARGE):
+            self.seed(size)
+            ctx.refresh(size)
+            for label, build in CASES:
+                run_budget_case(ctx, *build(ctx))  # warm caches
+                counts[label, size] = run_budget_case(ctx, *build(ctx))
+        self.assertEqual(uncovered_urls(match for _, match, _, _ in counts.values()), [])
+        for label, _ in CASES:
+            with self.subTest(case=label):
+                (low, _, _, _), (high, _, budget, _) = counts[label, BUDGET_SPARE_LEADS], counts[label, LARGE]
+                self.assertIsNotNone(budget)
+                self.assertLessEqual(high, budget)
+                self.assertLessEqual(high, low)
+
+
+def _csv(*rows):
+    """An upload CSV with a first_name,last_name,phone_number header."""
+    lines = ['first_name,last_name,phone_number', *(','.join(row) for row in rows)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class ImportJobTests(LeadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def _job(self, content, **fields):
+        job = ImportJob(original_name='leads.csv', created_by=self.user, **fields)
+        job.file.save('leads.csv', ContentFile(content), save=False)
+        job.save()
+        return job
+
+    def test_upload_imports_in_the_request_by_default(self):
+        upload = SimpleUploadedFile('leads.csv', _csv(['Ada', 'Obi', '08031234567']))
+        response = self.client.post(reverse('leads:lead_upload'), {'file': upload, 'duplicates': 'allow'})
+        self.assertRedirects(response, reverse('leads:lead_list'), fetch_redirect_response=False)
+        self.assertEqual(Lead.objects.count(), 1)
+        self.assertFalse(ImportJob.objects.exists())
+
+    @override_settings(LEADS_IMPORT_BACKGROUND=True)
+    def test_background_upload_is_queued(self):
+        upload = SimpleUploadedFile('leads.csv', _csv(['Ada', 'Obi', '08031234567']))
+        self.client.post(reverse('leads:lead_upload'), {'file': upload, 'duplicates': 'allow'})
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.STATUS_PENDING)
+        self.assertFalse(Lead.objects.exists())
+
+    def test_claims_pending_jobs_first(self):
+        self._job(b'', status=ImportJob.STATUS_RUNNING, heartbeat_at=timezone.now() - timedelta(days=1))
+        pending = self._job(b'')
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, pending.pk)
+        self.assertEqual(claimed.status, ImportJob.STATUS_RUNNING)
+        self.assertIsNotNone(claimed.heartbeat_at)
+
+    @override_settings(LEADS_IMPORT_STALE_SECONDS=60)
+    def test_reclaims_only_stale_running_jobs(self):
+        self._job(b'', status=ImportJob.STATUS_RUNNING, heartbeat_at=timezone.now())
+        self.assertIsNone(claim_next_job())
+        stale = self._job(b'', status=ImportJob.STATUS_RUNNING, heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(claim_next_job().pk, stale.pk)
+        # Its heartbeat is fresh again, so no second worker takes it
+        self.assertIsNone(claim_next_job())
+
+    def test_resumed_job_skips_committed_rows(self):
+        content = _csv(*([f'Lead{i}', 'Obi', f'0803123450{i}'] for i in range(5)))
+        job = self._job(content, status=ImportJob.STATUS_RUNNING, rows_processed=3, success_count=3)
+        job = run_import_job(job)
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(job.success_count, 5)
+        self.assertEqual(sorted(Lead.objects.values_list('first_name', flat=True)), ['Lead3', 'Lead4'])
+
+    def test_progress_records_heartbeat_and_error_count(self):
+        job = self._job(_csv(['Ada', 'Obi', '1'], ['', 'Nameless', '2']), status=ImportJob.STATUS_RUNNING)
+        job = run_import_job(job)
+        self.assertEqual(job.rows_processed, 2)
+        self.assertEqual(job.error_count, len(job.errors))
+        self.assertEqual(job.error_count, 1)
+
+    def test_progress_poll_does_not_load_errors(self):
+        job = self._job(b'', status=ImportJob.STATUS_DONE, errors=['Row 2: bad'] * 1000, error_count=1000)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leads:import_job_progress', args=[job.pk]))
+        self.assertEqual(response.json()['error_count'], 1000)
+        job_query = next(q['sql'] for q in queries.captured_queries if 'leads_importjob' in q['sql'])
+        self.assertNotIn('"errors"', job_query)
+
+    def test_waiting_for_worker(self):
+        job = self._job(b'')
+        url = reverse('leads:import_job_detail', args=[job.pk])
+        self.assertFalse(waiting_for_worker(job))
+        self.assertContains(self.client.get(url), 'alert-warning d-none')
+        ImportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        job.refresh_from_db()
+        self.assertTrue(waiting_for_worker(job))
+        self.assertNotContains(self.client.get(url), 'alert-warning d-none')
+
+
+class ImportTests(LeadTestCase):
+
+    def _import(self, content, **kwargs):
+        return import_leads_from_file(SimpleUploadedFile('leads.csv', content), **kwargs)
+
+    def test_rows_import_in_batches_with_row_numbered_errors(self):
+        content = _csv(*([f'Lead{i}', 'Obi', f'0803123450{i}'] for i in range(5)), ['', 'Nameless', '1'])
+        imported, errors = self._import(content, batch_size=2)
+        self.assertEqual(imported, 5)
+        self.assertEqual(errors, ['Row 7: Missing first name, skipped'])
+        self.assertEqual(Lead.objects.count(), 5)
+
+
+class DuplicateImportTests(LeadTestCase):
+
+    def _import(self, duplicates, *rows, header='first_name,last_name,phone_number,email', **kwargs):
+        content = '\n'.join([header, *(','.join(row) for row in rows)]) + '\n'
+        return import_leads_from_file(SimpleUploadedFile('leads.csv', content.encode()), duplicates=duplicates, **kwargs)
+
+    def test_matches_existing_leads_by_phone_email_and_name(self):
+        Lead.objects.create(first_name='Ada', phone_number='+234 803 123 4567')
+        Lead.objects.create(first_name='Bola', email='Bola@Example.com')
+        Lead.objects.create(first_name='Mary Ann', last_name='Obi')
+        imported, errors = self._import(
+            DUPLICATES_SKIP,
+            ['Ada', '', '08031234567', ''], ['Bola', '', '', 'bola@example.COM'], ['Mary', 'Ann Obi', '', ''],
+            ['Chidi', '', '', ''],
+        )
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, ['3 duplicate row(s) skipped: rows 2, 3, 4.'])
+
+    def test_lead_with_contacts_is_not_matched_by_name(self):
+        Lead.objects.create(first_name='Ada', last_name='Obi', phone_number='08031234567')
+        imported, _ = self._import(DUPLICATES_SKIP, ['Ada', 'Obi', '', ''])
+        self.assertEqual(imported, 1)
+
+    def test_merged_rows_are_not_counted_as_imported(self):
+        lead = Lead.objects.create(first_name='Ada', phone_number='08031234567')
+        imported, errors = self._import(
+            DUPLICATES_UPDATE, ['Ada', 'Obi', '08031234567', 'ada@example.com'], ['Chidi', '', '', ''],
+        )
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, ['1 duplicate row(s) merged into existing leads: rows 2.'])
+        lead.refresh_from_db()
+        self.assertEqual((lead.last_name, lead.email), ('Obi', 'ada@example.com'))
+
+    def test_duplicates_within_the_file_across_batches(self):
+        imported, errors = self._import(
+            DUPLICATES_FLAG, ['Ada', '', '08031234567', ''], ['Chidi', '', '', ''], ['Ada', 'Obi', '0803 123 4567', ''],
+            batch_size=1,
+        )
+        self.assertEqual(imported, 3)
+        flagged = Lead.objects.exclude(duplicate_of=None).get()
+        self.assertEqual(flagged.last_name, 'Obi')
+        self.assertEqual(flagged.duplicate_of.first_name, 'Ada')
+
+    def test_row_whose_insert_failed_is_not_a_duplicate_target(self):
+        write_batch = services._write_batch
+        calls = []
+
+        def fail_first_batch(batch, errors):
+            calls.append(batch)
+            if len(calls) == 1:
+                errors.append(f'Row {batch[0][0]}: insert failed')
+                return 0
+            return write_batch(batch, errors)
+
+        with mock.patch.object(services, '_write_batch', fail_first_batch):
+            imported, errors = self._import(
+                DUPLICATES_SKIP, ['Ada', '', '08031234567', ''], ['Ada', 'Obi', '08031234567', ''], batch_size=1,
+            )
+        self.assertEqual(imported, 1)
+        self.assertEqual(errors, ['Row 2: insert failed'])
+        self.assertEqual(Lead.objects.get().last_name, 'Obi')
+
+
+class SearchTests(LeadTestCase):
+
+    def _lead(self, first_name, last_name='', **fields):
+        return Lead.objects.create(first_name=first_name, last_name=last_name, **fields)
+
+    def _list_ids(self, params):
+        response = self.get(reverse('leads:lead_list'), params)
+        return [lead.pk for lead in response.context['leads']], response.context['leads']
+
+    def test_list_orders_search_results_by_relevance(self):
+        strong = self._lead('Okafor', 'Okafor', remarks='Okafor family referral')
+        weak = self._lead('Chinedu', 'Okafor', remarks='Budget around 45m naira, wants a terrace')
+        # Updated later, so it would come first in the default order
+        weak.save()
+        ids, _ = self._list_ids({'search': 'okafor'})
+        self.assertEqual(ids, [strong.pk, weak.pk])
+
+    def test_ranked_results_page_through_every_match_once(self):
+        for i in range(7):
+            self._lead('Okafor', 'Okafor ' * (i % 3), remarks=f'note {i}')
+        self._lead('Unrelated')
+        seen, cursor = [], None
+        while True:
+            params = {'search': 'okafor', 'per_page': 2}
+            if cursor:
+                params['cursor'] = cursor
+            ids, page = self._list_ids(params)
+            seen += ids
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), set(Lead.objects.filter(first_name='Okafor').values_list('pk', flat=True)))
+        # And back again from the last page
+        _, page = self._list_ids({'search': 'okafor', 'per_page': 2, 'cursor': page.prev_cursor})
+        self.assertEqual([lead.pk for lead in page], seen[-3:-1])
+
+    def test_sqlite_search_matches_word_prefixes(self):
+        lead = self._lead('Emeka', 'Okafor')
+        self.assertEqual(list(Lead.objects.search('oka')), [lead])
+        self.assertEqual(list(Lead.objects.search('emeka oka')), [lead])
+        self.assertEqual(list(Lead.objects.search('kafor')), [])
+
+    def test_export_orders_search_results_by_relevance(self):
+        self._lead('Chinedu', 'Okafor')
+        self._lead('Okafor', 'Okafor', remarks='Okafor')
+        response = self.client.get(reverse('leads:lead_download'), {'search': 'okafor'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(rows[1].startswith('Okafor,Okafor'))
+
+
+@override_settings(CACHES=LOCMEM)
+class SearchIndexRepairTests(TransactionTestCase):
+
+    def test_missing_triggers_are_reinstalled(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {FTS_TABLE}_ai')
+        self.assertFalse(_sqlite_fts_installed(connection))
+        ensure_search_index()
+        self.assertTrue(_sqlite_fts_installed(connection))
+        lead = Lead.objects.create(first_name='Ngozi')
+        self.assertEqual(list(Lead.objects.search('ngozi')), [lead])
+
+
+class CounterTests(LeadTestCase):
+    """The dashboard counters agree with a recount after every kind of write."""
+
+    def assertCountersMatch(self):
+        stored = {key: count for key, count in stored_counts(LeadCounter).items() if count}
+        actual = {key: count for key, count in count_leads(Lead).items() if count}
+        self.assertEqual(stored, actual)
+
+    def test_create_update_and_delete(self):
+        lead = Lead.objects.create(first_name='Ada', status='new', assigned_to=self.staff[0])
+        self.assertCountersMatch()
+        lead.status, lead.color_code = 'contacted', '#28a745'
+        lead.save()
+        self.assertCountersMatch()
+        lead.assigned_to = self.staff[1]
+        lead.save()
+        self.assertCountersMatch()
+        lead.delete()
+        self.assertCountersMatch()
+
+    def test_saving_a_loaded_lead_does_not_read_it_back(self):
+        Lead.objects.create(first_name='Ada')
+        lead = Lead.objects.get()
+        lead.status = 'won'
+        with CaptureQueriesContext(connection) as queries:
+            lead.save()
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('SELECT') and '"leads_lead"' in q['sql']])
+        self.assertCountersMatch()
+
+    def test_update_fields(self):
+        lead = Lead.objects.create(first_name='Ada')
+        lead.status, lead.color_code = 'won', '#dc3545'
+        lead.save(update_fields=['remarks'])
+        self.assertCountersMatch()
+        # The unsaved color is not counted
+        lead.save(update_fields=['status'])
+        self.assertCountersMatch()
+        lead.save()
+        self.assertCountersMatch()
+
+    def test_leads_without_loaded_state_are_read_back(self):
+        lead = Lead.objects.create(first_name='Ada', status='contacted')
+        Lead(pk=lead.pk, first_name='Ada', status='won', created_at=lead.created_at).save()
+        self.assertCountersMatch()
+        partial = Lead.objects.only('first_name').get()
+        partial.status = 'lost'
+        partial.save()
+        self.assertCountersMatch()
+
+    def test_refresh_from_db(self):
+        lead = Lead.objects.create(first_name='Ada')
+        copy = Lead.objects.get()
+        copy.status = 'won'
+        copy.save()
+        lead.refresh_from_db()
+        lead.status = 'lost'
+        lead.save()
+        self.assertCountersMatch()
+
+    def test_bulk_actions_import_and_merge(self):
+        self.seed(SMALL)
+        apply_bulk_action(Lead.objects.filter(status='new'), ACTION_STATUS, 'qualified', batch_size=3)
+        self.assertCountersMatch()
+        apply_bulk_action(Lead.objects.all(), ACTION_ASSIGN, self.staff[2].pk, batch_size=7)
+        self.assertCountersMatch()
+        apply_bulk_action(Lead.objects.filter(pk__in=Lead.objects.order_by('pk').values('pk')[:5]), ACTION_DELETE)
+        self.assertCountersMatch()
+        import_leads_from_file(SimpleUploadedFile('leads.csv', _csv(['Ada', 'Obi', '08031234567'])))
+        import_leads_from_file(
+            SimpleUploadedFile('leads.csv', b'first_name,phone_number,status\nAda,08031234567,won\n'),
+            duplicates=DUPLICATES_UPDATE,
+        )
+        self.assertCountersMatch()
+        Lead.objects.create(first_name='Ada', phone_number='0803 123 4567', status='lost')
+        call_command('dedupe_leads', similarity=1, stdout=StringIO())
+        self.assertCountersMatch()
+
+    def test_deleting_staff_moves_their_count_to_unassigned(self):
+        for i in range(3):
+            Lead.objects.create(first_name=f'Lead{i}', assigned_to=self.staff[i % 2])
+        self.staff[0].delete()
+        self.assertCountersMatch()
+
+
+class BulkDeleteTests(LeadTestCase):
+
+    def test_delete_clears_duplicate_of_and_records_tombstones(self):
+        original = Lead.objects.create(first_name='Ada')
+        flagged = Lead.objects.create(first_name='Ada', duplicate_of=original)
+        other = Lead.objects.create(first_name='Bayo')
+        deleted = apply_bulk_action(Lead.objects.filter(pk__in=[original.pk, other.pk]), ACTION_DELETE)
+        self.assertEqual(deleted, 2)
+        flagged.refresh_from_db()
+        self.assertIsNone(flagged.duplicate_of_id)
+        self.assertEqual(
+            sorted(LeadTombstone.objects.values_list('lead_id', flat=True)), [original.pk, other.pk],
+        )
+
+    def test_delete_queries_do_not_grow_with_the_chunk(self):
+        # Counter writes grow with the distinct counter values, not the leads. Sizes stay
+        # under the 100 ids Django's collector puts in one DELETE
+        queries = []
+        for size in (SMALL, 90):
+            self.seed(size)
+            with CaptureQueriesContext(connection) as captured:
+                apply_bulk_action(Lead.objects.all(), ACTION_DELETE, batch_size=size)
+            queries.append(len([query for query in captured if 'leads_leadcounter' not in query['sql']]))
+        self.assertEqual(queries[0], queries[1])
+
+
+@override_settings(LEADS_EXPORT_SETTLE_SECONDS=0)
+class ChangeExportTests(LeadTestCase):
+
+    def _changes(self, params):
+        response = self.client.get(reverse('leads:lead_download'), {'since': '1970-01-01T00:00:00Z,0', **params})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).decode().splitlines()[1:]
+        return {int(row.split(',')[0]): row.split(',')[-1] for row in rows}
+
+    def test_filtered_export_reports_leads_leaving_the_filter(self):
+        kept = Lead.objects.create(first_name='Ada', status='new')
+        moved = Lead.objects.create(first_name='Bayo', status='new')
+        deleted = Lead.objects.create(first_name='Chike', status='new')
+        moved.status = 'contacted'
+        moved.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        self.assertEqual(
+            self._changes({'status': 'new'}), {kept.pk: '', moved.pk: 'filtered', deleted_pk: 'yes'},
+        )
+
+    def test_unfiltered_export_has_no_filtered_rows(self):
+        lead = Lead.objects.create(first_name='Ada', status='contacted')
+        self.assertEqual(self._changes({}), {lead.pk: ''})
+
+    def test_changes_are_read_from_the_primary(self):
+        lead = Lead.objects.create(first_name='Ada')
+        # A replica alias would not even exist here
+        with mock.patch('leads.views.read_alias', return_value='replica'):
+            self.assertEqual(self._changes({}), {lead.pk: ''})
+
+
+class LeadRowsTests(LeadTestCase):
+
+    def test_next_url_carries_only_the_list_filters(self):
+        for i in range(3):
+            Lead.objects.create(first_name=f'Ada{i}', status='new')
+        response = self.get(reverse('leads:lead_rows'), {
+            'status': 'new', 'per_page': '1', 'evil': 'guess123', 'search': '',
+        })
+        path, querystring = response.context['rows_next_url'].split('?')
+        self.assertNotIn('guess123', response.content.decode())
+        self.assertEqual(path, reverse('leads:lead_rows'))
+        params = QueryDict(querystring)
+        self.assertEqual(sorted(params), ['cursor', 'per_page', 'status'])
+        self.assertEqual(params['status'], 'new')
+
+    def test_rows_are_compressed(self):
+        self.seed(SMALL)
+        response = self.client.get(reverse('leads:lead_rows'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class MetricsMiddlewareTests(LeadTestCase):
+
+    def _recorded(self, view):
+        return metrics._requests.series.get((view, 'GET', 200), 0)
+
+    def test_request_is_recorded_and_unwrapped(self):
+        before = self._recorded('leads:lead_list')
+        self.get(reverse('leads:lead_list'))
+        self.assertEqual(self._recorded('leads:lead_list'), before + 1)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_streamed_queries_count_towards_the_request(self):
+        Lead.objects.create(first_name='Ada')
+        labels = ('leads:lead_download', 'GET')
+        before = metrics._queries.series.get(labels, [0, 0])[-1]
+        self.get(reverse('leads:lead_download'))
+        # session, user and the export query, run while streaming
+        self.assertEqual(metrics._queries.series[labels][-1] - before, 3)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_unclosed_stream_is_closed_when_the_next_request_finishes(self):
+        before = self._recorded('leads:lead_download')
+        self.client.get(reverse('leads:lead_download'))
+        self.assertEqual(len(connection.execute_wrappers), 1)
+        self.get(reverse('leads:lead_list'))
+        self.assertEqual(connection.execute_wrappers, [])
+        self.assertEqual(self._recorded('leads:lead_download'), before + 1)
+
+
+class ApiTests(LeadTestCase):
+
+    def test_updated_since_filters_leads(self):
+        lead = Lead.objects.create(first_name='Ada')
+        url = reverse('leads:api_lead_list')
+        response = self.client.get(url, {'updated_since': '2000-01-01T00:00:00Z'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [lead.pk])
+
+    def test_invalid_updated_since_is_a_bad_request(self):
+        url = reverse('leads:api_lead_list')
+        for value in ('yesterday', '2024-13-45T00:00:00', '2024-02-30T25:00:00'):
+            with self.subTest(value=value):
+                response = self.client.get(url, {'updated_since': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'updated_since must be an ISO 8601 datetime.'})
+
+    def test_invalid_staff_is_a_bad_request(self):
+        url = reverse('leads:api_lead_list')
+        for value in ('abc', '-1', '0', str(2 ** 63)):
+            with self.subTest(value=value):
+                response = self.client.get(url, {'staff': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'staff must be a user id.'})
+
+    def test_invalid_staff_matches_no_leads_elsewhere(self):
+        lead = Lead.objects.create(first_name='Ada')
+        response = self.get(reverse('leads:lead_rows'), {'staff': 'abc'})
+        self.assertEqual(list(response.context['leads']), [])
+        response = self.client.post(reverse('leads:lead_bulk_action'), {
+            'action': 'status:won', 'scope': 'all', 'staff': 'abc',
+        })
+        self.assertEqual(response.status_code, 302)
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, 'new')
+
+    def test_unchanged_list_and_lead_are_not_modified(self):
+        lead = Lead.objects.create(first_name='Ada')
+        for url in (reverse('leads:api_lead_list'), reverse('leads:api_lead_detail', args=[lead.pk])):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                lead.save()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_to_a_changed_lead_are_refused(self):
+        lead = Lead.objects.create(first_name='Ada')
+        url = reverse('leads:api_lead_detail', args=[lead.pk])
+        etag = self.client.get(url)['ETag']
+        Lead.objects.get(pk=lead.pk).save()  # someone else's edit
+        response = self.client.patch(
+            url, '{"status": "won"}', content_type='application/json', HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.client.delete(url, HTTP_IF_MATCH=etag).status_code, 412)
+        lead.refresh_from_db()
+        self.assertEqual(lead.status, 'new')
+        response = self.client.patch(
+            url, '{"status": "won"}', content_type='application/json', HTTP_IF_MATCH=self.client.get(url)['ETag'],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'won')
+
+
+class MergeTests(LeadTestCase):
+
+    def _pair(self):
+        older = Lead.objects.create(
+            first_name='Ada', phone_number='08031234567', status='qualified', point_of_contact='Referral',
+            prospect_response='Wants a duplex', assigned_to=self.staff[0], source='Website', remarks='Called twice',
+        )
+        newer = Lead.objects.create(first_name='Ada', last_name='Obi', phone_number='0803 123 4567', remarks='New note')
+        return older, newer
+
+    def test_survivor_blanks_are_filled_from_losers(self):
+        older, newer = self._pair()
+        survivor, losers = merge_leads([older, newer])
+        self.assertEqual((survivor.pk, losers), (newer.pk, [older]))
+        self.assertEqual(survivor.status, 'qualified')
+        self.assertEqual(survivor.point_of_contact, 'Referral')
+        self.assertEqual(survivor.prospect_response, 'Wants a duplex')
+        self.assertEqual(survivor.assigned_to_id, self.staff[0].pk)
+        self.assertEqual(survivor.last_name, 'Obi')
+        self.assertEqual(survivor.remarks, 'New note\n\nCalled twice')
+
+    def test_survivor_values_are_kept(self):
+        older, newer = self._pair()
+        Lead.objects.filter(pk=newer.pk).update(status='contacted', source='Walk-in')
+        newer.refresh_from_db()
+        survivor, _ = merge_leads([older, newer])
+        self.assertEqual((survivor.status, survivor.source), ('contacted', 'Walk-in'))
+
+    def test_dedupe_leads_saves_filled_fields(self):
+        older, newer = self._pair()
+        call_command('dedupe_leads', similarity=1, stdout=StringIO())
+        survivor = Lead.objects.get()
+        self.assertEqual(survivor.pk, newer.pk)
+        self.assertEqual(
+            (survivor.status, survivor.point_of_contact, survivor.prospect_response, survivor.assigned_to_id),
+            ('qualified', 'Referral', 'Wants a duplex', self.staff[0].pk),
+        )
+
+    def test_dedupe_leads_stamps_changed_leads(self):
+        older, newer = self._pair()
+        flagged = Lead.objects.create(first_name='Bayo', duplicate_of=older)
+        before = timezone.now()
+        call_command('dedupe_leads', similarity=1, stdout=StringIO())
+        survivor, flagged = Lead.objects.get(pk=newer.pk), Lead.objects.get(pk=flagged.pk)
+        self.assertEqual(flagged.duplicate_of_id, survivor.pk)
+        self.assertGreaterEqual(survivor.updated_at, before)
+        self.assertGreaterEqual(flagged.updated_at, before)
+        # So the next incremental export carries the merged survivor
+        export = services.export_leads_to_csv(
+            Lead.objects.for_export(), since=parse_watermark(f'{before.isoformat()},0'),
+            until=Watermark(timezone.now() + timedelta(seconds=1), 0),
+        )
+        rows = list(csv.reader(StringIO(export)))[1:]
+        self.assertEqual({int(row[0]) for row in rows}, {older.pk, survivor.pk, flagged.pk})
+
+
+class PhoneSearchTests(LeadTestCase):
+
+    def test_phone_search_matches_number_in_any_format(self):
+        lead = Lead.objects.create(first_name='Ada', phone_number='0803 123 4567')
+        for term in ('+234 803 123 4567', '08031234567', '803-123-4567'):
+            with self.subTest(term=term):
+                self.assertEqual(list(Lead.objects.search(term)), [lead])
+
+    def test_phone_search_keeps_text_matches(self):
+        prefix = Lead.objects.create(first_name='Ada', phone_number='08031234567')
+        remarks = Lead.objects.create(first_name='Bola', remarks='Reference 4455667 from the agent')
+        self.assertEqual(list(Lead.objects.search('0803123')), [prefix])
+        self.assertEqual(list(Lead.objects.search('4455667')), [remarks])
+
+
+FILE_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def _ids(self):
+        return [warning.id for warning in check_shared_cache(None)]
+
+    @override_settings(CACHES=LOCMEM, DEBUG=False, LEADS_IMPORT_BACKGROUND=False)
+    def test_locmem_in_production_warns(self):
+        self.assertEqual(self._ids(), ['leads.W001'])
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True, LEADS_IMPORT_BACKGROUND=True)
+    def test_locmem_with_background_imports_warns(self):
+        self.assertEqual(self._ids(), ['leads.W002'])
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True, LEADS_IMPORT_BACKGROUND=False)
+    def test_locmem_for_a_single_debug_process_is_fine(self):
+        self.assertEqual(self._ids(), [])
+
+    @override_settings(CACHES=FILE_CACHE, DEBUG=False, LEADS_IMPORT_BACKGROUND=True)
+    def test_shared_cache_is_fine(self):
+        self.assertEqual(self._ids(), [])
+
+
+class SqliteTransactionCheckTests(TestCase):
+
+    def _ids(self, **options):
+        with mock.patch.dict(connections.settings['default'], options):
+            return [warning.id for warning in check_sqlite_request_transactions(None)]
+
+    def test_atomic_requests_with_immediate_transactions_warns(self):
+        ids = self._ids(ATOMIC_REQUESTS=True, OPTIONS={'transaction_mode': 'IMMEDIATE'})
+        self.assertEqual(ids, ['leads.W003'])
+
+    def test_deferred_or_per_write_transactions_are_fine(self):
+        self.assertEqual(self._ids(ATOMIC_REQUESTS=True, OPTIONS={'transaction_mode': 'DEFERRED'}), [])
+        self.assertEqual(self._ids(ATOMIC_REQUESTS=False, OPTIONS={'transaction_mode': 'IMMEDIATE'}), [])
@@ -6,15 +6,28 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from django.http import HttpResponse
-from django.db.models import Q, Count
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, QueryDict, StreamingHttpResponse
 from django.contrib.auth.models import User
-
-from .models import Lead
-from .forms import LeadForm, LeadUploadForm, StyledAuthenticationForm, StyledUserCreationForm
-from .services import import_leads_from_file, export_leads_to_csv, export_leads_to_excel
-
-
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_POST
+
+from .models import ImportJob, Lead
+from .budgets import query_budget
+from .bulk import ACTION_DELETE, apply_bulk_action
+from .jobs import waiting_for_worker
+from .forms import LeadBulkActionForm, LeadForm, LeadUploadForm, StyledAuthenticationForm, StyledUserCreationForm, active_staff
+from .cache import LEADS, USERS, cached
+from .counters import dashboard_counts
+from .delta import next_watermark, parse_watermark
+from .pagination import KeysetPaginator, cursor_querystring, page_size_from
+from .routers import read_alias, replica_reads
+from .services import import_leads_from_file, iter_lead_changes_csv, iter_leads_csv, spool_leads_to_excel
+
+
+@query_budget(0, POST=3)
 def register_view(request):
     """User registration."""
     if request.user.is_authenticated:
@@ -30,6 +43,7 @@ def register_view(request):
     return render(request, 'leads/register.html', {'form': form})
 
 
+@query_budget(0, POST=9)
 def login_view(request):
     """User login."""
     if request.user.is_authenticated:
@@ -46,6 +60,7 @@ def login_view(request):
     return render(request, 'leads/login.html', {'form': form})
 
 
+@query_budget(4)
 def logout_view(request):
     """User logout - handled by Django auth."""
     from django.contrib.auth import logout
@@ -53,69 +68,132 @@ def logout_view(request):
     return redirect('leads:login')
 
 
+def _dashboard_summary():
+    """Stats cards and staff badges for the lead list, from the maintained counters."""
+    counts = dashboard_counts()
+    stats = {'total': counts['total']}
+    for status in ('new', 'contacted', 'qualified', 'won'):
+        stats[status] = counts['status'].get(status, 0)
+
+    # Staff breakdown (users who have assigned leads)
+    staff_counts = {pk: n for pk, n in counts['staff'].items() if pk is not None}
+    staff_with_leads = [
+        {'id': pk, 'username': username, 'lead_count': staff_counts[pk]}
+        for pk, username in User.objects.filter(pk__in=staff_counts).values_list('id', 'username')
+    ]
+    staff_with_leads.sort(key=lambda user: -user['lead_count'])
+    return {'stats': stats, 'staff_with_leads': staff_with_leads}
+
+
+def _lead_page(request):
+    """The keyset page of leads for the list filters and cursor in the querystring; searches by relevance."""
+    queryset = Lead.objects.for_list().apply_filters(request.GET, ranked=True)
+    return KeysetPaginator(queryset, page_size_from(request.GET)).get_page(request.GET.get('cursor'))
+
+
+def _rows_context(request, page):
+    """Context for leads/_lead_rows.html: the page's rows and the fragment URL of the next page."""
+    return {
+        'leads': page,
+        'rows_next_url': (
+            reverse('leads:lead_rows') + cursor_querystring(_rows_params(request.GET), page.next_cursor)
+            if page.has_next else ''
+        ),
+    }
+
+
+def _rows_params(params):
+    """
+    The list filters and page size of ``params``, for the next rows URL.
+    Nothing else from the querystring is echoed into the (compressed) rows.
+    """
+    query = QueryDict(mutable=True)
+    for key in LIST_FILTER_PARAMS:
+        if params.get(key):
+            query[key] = params[key]
+    if params.get('per_page'):
+        query['per_page'] = page_size_from(params)
+    return query
+
+
+@query_budget(3)
 @login_required
+@replica_reads
 def lead_list(request):
-    """List all leads with search, filter, and color coding."""
-    queryset = Lead.objects.all()
-
-    # Search
+    """List leads with search, filter, color coding and keyset pagination."""
     search = request.GET.get('search', '').strip()
-    if search:
-        queryset = queryset.filter(
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search) |
-            Q(phone_number__icontains=search) |
-            Q(email__icontains=search) |
-            Q(remarks__icontains=search) |
-            Q(point_of_contact__icontains=search)
-        )
-
-    # Filter by status
     status_filter = request.GET.get('status', '')
-    if status_filter:
-        queryset = queryset.filter(status=status_filter)
-
-    # Filter by color
     color_filter = request.GET.get('color', '')
-    if color_filter:
-        queryset = queryset.filter(color_code=color_filter)
-
-    # Filter by staff
     staff_filter = request.GET.get('staff', '')
-    if staff_filter:
-        queryset = queryset.filter(assigned_to_id=staff_filter)
-
-    # Stats for dashboard
-    stats = Lead.objects.aggregate(
-        total=Count('id'),
-        new=Count('id', filter=Q(status='new')),
-        contacted=Count('id', filter=Q(status='contacted')),
-        qualified=Count('id', filter=Q(status='qualified')),
-        won=Count('id', filter=Q(status='won')),
-    )
 
-    # Staff breakdown (users who have assigned leads)
-    staff_with_leads = User.objects.filter(
-        assigned_leads__isnull=False
-    ).annotate(
-        lead_count=Count('assigned_leads')
-    ).order_by('-lead_count')
+    page = _lead_page(request)
+
+    dashboard = cached('lead_dashboard', [LEADS, USERS], _dashboard_summary)
 
     context = {
-        'leads': queryset,
-        'stats': stats,
-        'staff_with_leads': staff_with_leads,
+        **_rows_context(request, page),
+        'next_url': cursor_querystring(request.GET, page.next_cursor) if page.has_next else '',
+        'prev_url': cursor_querystring(request.GET, page.prev_cursor) if page.has_previous else '',
+        'stats': dashboard['stats'],
+        'staff_with_leads': dashboard['staff_with_leads'],
         'search': search,
         'status_filter': status_filter,
         'color_filter': color_filter,
         'staff_filter': staff_filter,
         'color_choices': Lead.COLOR_CHOICES,
         'status_choices': Lead.STATUS_CHOICES,
-        'staff_users': User.objects.filter(is_active=True).order_by('username'),
+        'staff_users': active_staff(),
+        'bulk_form': LeadBulkActionForm(),
     }
     return render(request, 'leads/lead_list.html', context)
 
 
+@query_budget(3)
+@gzip_page
+@login_required
+@replica_reads
+def lead_rows(request):
+    """
+    Just the table rows of one lead list page, for infinite scroll and live
+    filtering: same filters and cursor as lead_list, without the stats,
+    staff breakdown and filter form around them.
+    """
+    return render(request, 'leads/_lead_rows.html', _rows_context(request, _lead_page(request)))
+
+
+# Lead list filters carried through a bulk action and back to the list
+LIST_FILTER_PARAMS = ('search', 'status', 'color', 'staff')
+
+
+@query_budget(10)
+@login_required
+@require_POST
+def lead_bulk_action(request):
+    """Apply a bulk action to the ticked leads, or to every lead matching the list filters."""
+    filters = request.POST.copy()
+    for key in list(filters):
+        if key not in LIST_FILTER_PARAMS or not filters[key]:
+            del filters[key]
+    back = reverse('leads:lead_list') + ('?' + filters.urlencode() if filters else '')
+
+    form = LeadBulkActionForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            messages.error(request, errors[0])
+        return redirect(back)
+
+    action, value = form.cleaned_data['action']
+    if form.cleaned_data['scope'] == LeadBulkActionForm.SCOPE_ALL:
+        queryset = Lead.objects.apply_filters(filters)
+    else:
+        queryset = Lead.objects.filter(pk__in=form.cleaned_data['ids'])
+    count = apply_bulk_action(queryset, action, value)
+    verb = 'Deleted' if action == ACTION_DELETE else 'Updated'
+    messages.success(request, f'{verb} {count} lead(s).')
+    return redirect(back)
+
+
+@query_budget(2, POST=9)
 @login_required
 def lead_create(request):
     """Create a new lead."""
@@ -132,6 +210,7 @@ def lead_create(request):
     return render(request, 'leads/lead_form.html', {'form': form, 'title': 'Add New Lead'})
 
 
+@query_budget(3, POST=13)
 @login_required
 def lead_edit(request, pk):
     """Edit an existing lead."""
@@ -147,13 +226,16 @@ def lead_edit(request, pk):
     return render(request, 'leads/lead_form.html', {'form': form, 'title': 'Edit Lead', 'lead': lead})
 
 
+@query_budget(3)
 @login_required
+@replica_reads
 def lead_detail(request, pk):
     """View lead details."""
-    lead = get_object_or_404(Lead, pk=pk)
+    lead = get_object_or_404(Lead.objects.for_detail(), pk=pk)
     return render(request, 'leads/lead_detail.html', {'lead': lead})
 
 
+@query_budget(3, POST=10)
 @login_required
 def lead_delete(request, pk):
     """Delete a lead."""
@@ -166,6 +248,7 @@ def lead_delete(request, pk):
     return render(request, 'leads/lead_confirm_delete.html', {'lead': lead})
 
 
+@query_budget(3, POST=12)
 @login_required
 def lead_upload(request):
     """Bulk upload leads from CSV or Excel."""
@@ -173,7 +256,14 @@ def lead_upload(request):
         form = LeadUploadForm(request.POST, request.FILES)
         if form.is_valid():
             file = request.FILES['file']
-            success_count, errors = import_leads_from_file(file, user=request.user)
+            duplicates = form.cleaned_data['duplicates']
+            if settings.LEADS_IMPORT_BACKGROUND:
+                job = ImportJob.objects.create(
+                    file=file, original_name=file.name, duplicate_policy=duplicates, created_by=request.user,
+                )
+                messages.info(request, f'"{file.name}" queued for import.')
+                return redirect('leads:import_job_detail', pk=job.pk)
+            success_count, errors = import_leads_from_file(file, user=request.user, duplicates=duplicates)
             if success_count > 0:
                 messages.success(request, f'Successfully imported {success_count} lead(s).')
             for err in errors[:5]:  # Show first 5 errors
@@ -184,9 +274,35 @@ def lead_upload(request):
         messages.error(request, 'Please select a valid CSV or Excel file.')
     else:
         form = LeadUploadForm()
-    return render(request, 'leads/lead_upload.html', {'form': form})
+    recent_jobs = ImportJob.objects.filter(created_by=request.user).defer('errors')[:5]
+    return render(request, 'leads/lead_upload.html', {'form': form, 'recent_jobs': recent_jobs})
+
+
+@query_budget(3)
+@login_required
+def import_job_detail(request, pk):
+    """Progress and full error report for a background import."""
+    job = get_object_or_404(ImportJob, pk=pk)
+    return render(request, 'leads/import_job.html', {'job': job, 'waiting_for_worker': waiting_for_worker(job)})
 
 
+@query_budget(3)
+@login_required
+def import_job_progress(request, pk):
+    """JSON progress polled by the import job page."""
+    job = get_object_or_404(ImportJob.objects.defer('errors'), pk=pk)
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'finished': job.is_finished,
+        'rows_processed': job.rows_processed,
+        'success_count': job.success_count,
+        'error_count': job.error_count,
+        'waiting_for_worker': waiting_for_worker(job),
+    })
+
+
+@query_budget(2)
 @login_required
 def lead_download_template(request):
     """Download a sample CSV template for uploading leads."""
@@ -207,42 +323,53 @@ def lead_download_template(request):
     return response
 
 
+@query_budget(4)
 @login_required
+@replica_reads
 def lead_download(request):
-    """Download leads as CSV or Excel."""
+    """
+    Download leads as CSV or Excel. With ?since=<watermark>, download only
+    the leads changed or deleted since then, as CSV, and return the
+    watermark for the next run in the X-Next-Watermark header.
+    """
     format_type = request.GET.get('format', 'csv')
-    queryset = Lead.objects.all()
+    # Apply same filters as list view if passed (searches in relevance order, except
+    # for change exports). Bound to the read alias explicitly: the CSV is streamed
+    # after the view (and its routing) returns
+    ranked = not request.GET.get('since')
+    queryset = Lead.objects.for_export().apply_filters(request.GET, ranked=ranked).using(read_alias())
 
-    # Apply same filters as list view if passed
-    search = request.GET.get('search', '').strip()
-    if search:
-        queryset = queryset.filter(
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search) |
-            Q(phone_number__icontains=search) |
-            Q(email__icontains=search)
+    if request.GET.get('since'):
+        try:
+            since = parse_watermark(request.GET['since'])
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        until = next_watermark(since)
+        # Change exports read the primary: a lagging replica would miss changes
+        # before the watermark, and they would never be exported
+        queryset = queryset.using(DEFAULT_DB_ALIAS)
+        unfiltered = None
+        if any(request.GET.get(key) for key in LIST_FILTER_PARAMS):
+            unfiltered = Lead.objects.for_export()
+        response = StreamingHttpResponse(
+            iter_lead_changes_csv(queryset, since, until, unfiltered=unfiltered), content_type='text/csv',
         )
-    status_filter = request.GET.get('status', '')
-    if status_filter:
-        queryset = queryset.filter(status=status_filter)
-    color_filter = request.GET.get('color', '')
-    if color_filter:
-        queryset = queryset.filter(color_code=color_filter)
-    staff_filter = request.GET.get('staff', '')
-    if staff_filter:
-        queryset = queryset.filter(assigned_to_id=staff_filter)
+        response['Content-Disposition'] = 'attachment; filename="nissie_leads_changes.csv"'
+        response['X-Next-Watermark'] = str(until)
+        return response
 
     if format_type == 'excel':
         try:
-            content = export_leads_to_excel(queryset)
+            spool = spool_leads_to_excel(queryset)
         except ImportError:
             messages.error(request, 'Excel export requires openpyxl. Run: pip install openpyxl. Use CSV for now.')
             return redirect('leads:lead_list')
-        response = HttpResponse(content, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="nissie_leads.xlsx"'
+        response = FileResponse(
+            spool, as_attachment=True, filename='nissie_leads.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
     else:
-        content = export_leads_to_csv(queryset)
-        response = HttpResponse(content, content_type='text/csv')
+        response = StreamingHttpResponse(iter_leads_csv(queryset), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="nissie_leads.csv"'
 
     return response
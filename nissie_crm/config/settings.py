@@ -4,6 +4,8 @@ Django settings for Nissie Ideal Shelters CRM.
 import os
 from pathlib import Path
 
+import django
+
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -21,6 +23,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'leads.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -28,6 +31,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'leads.routers.ReplicaStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'nissie_crm.config.urls'
@@ -49,11 +53,71 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'nissie_crm.config.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database: sqlite (default) or postgres, configured from the environment
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+# Seconds to keep connections open between requests (0 = close after each request)
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'nissie_crm'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL', 'False').lower() == 'true':
+        # psycopg 3 connection pool (Django 5.1+); replaces persistent connections
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        }
+        DB_CONN_MAX_AGE = 0
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # busy_timeout: seconds to wait for the write lock before "database is locked"
+                'timeout': int(os.environ.get('DB_TIMEOUT', '20')),
+            },
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # Take the write lock when a transaction starts, so it waits on busy_timeout
+        # instead of failing when a read transaction later tries to write. Every
+        # atomic() block then holds the write lock, so only writes use atomic()
+        # and ATOMIC_REQUESTS stays off (checked by leads.W003).
+        DATABASES['default']['OPTIONS']['transaction_mode'] = os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
+DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+# Check a persistent connection is still usable before reusing it
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Optional read replica for the lead list, detail and export views (see leads/routers.py)
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST', '')
+DB_REPLICA_NAME = os.environ.get('DB_REPLICA_NAME', '')
+if DB_REPLICA_HOST or DB_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST or DATABASES['default'].get('HOST', ''),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        'NAME': DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['leads.routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after they save something
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '10'))
+
+# PRAGMAs run on every new SQLite connection (see leads/db.py); WAL lets
+# readers continue while a writer commits, and NORMAL is durable under WAL
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -80,3 +144,57 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'leads:login'
 LOGIN_REDIRECT_URL = 'leads:lead_list'
 LOGOUT_REDIRECT_URL = 'leads:login'
+
+# Lead list keyset pagination
+LEADS_PAGE_SIZE = int(os.environ.get('LEADS_PAGE_SIZE', '50'))
+LEADS_MAX_PAGE_SIZE = int(os.environ.get('LEADS_MAX_PAGE_SIZE', '200'))
+
+# Rows fetched per database round trip when streaming exports
+LEADS_EXPORT_CHUNK_SIZE = int(os.environ.get('LEADS_EXPORT_CHUNK_SIZE', '2000'))
+
+# Incremental exports stop this many seconds before now, so in-flight transactions are not skipped.
+# Keep it above the longest write transaction (an import batch, a bulk action batch)
+LEADS_EXPORT_SETTLE_SECONDS = int(os.environ.get('LEADS_EXPORT_SETTLE_SECONDS', '30'))
+
+# Leads changed per UPDATE/DELETE (and transaction) by lead list bulk actions
+LEADS_BULK_BATCH_SIZE = int(os.environ.get('LEADS_BULK_BATCH_SIZE', '1000'))
+
+# Leads inserted per bulk_create/transaction when importing files
+LEADS_IMPORT_BATCH_SIZE = int(os.environ.get('LEADS_IMPORT_BATCH_SIZE', '500'))
+
+# Queue uploads for `manage.py run_import_worker` instead of importing in the request
+LEADS_IMPORT_BACKGROUND = os.environ.get('LEADS_IMPORT_BACKGROUND', 'False').lower() == 'true'
+# A running import whose worker has not reported progress for this long is taken over by another worker
+LEADS_IMPORT_STALE_SECONDS = int(os.environ.get('LEADS_IMPORT_STALE_SECONDS', '600'))
+
+# Lead search backend: auto, sqlite_fts, postgres or icontains (see leads/search.py)
+LEADS_SEARCH_BACKEND = os.environ.get('LEADS_SEARCH_BACKEND', 'auto')
+
+# Country code given to national numbers with a leading 0 when normalising phones
+LEADS_DEFAULT_COUNTRY_CODE = os.environ.get('LEADS_DEFAULT_COUNTRY_CODE', '234')
+
+# Request metrics for the /metrics endpoint (see leads/metrics.py)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+# Requests slower than this are logged with their slowest queries
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', '1000'))
+# Trace each request's peak Python memory with tracemalloc (slow; for investigating)
+METRICS_TRACE_MEMORY = os.environ.get('METRICS_TRACE_MEMORY', 'False').lower() == 'true'
+# Bearer token Prometheus sends to /metrics; unset means staff users only
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Cache for lead list choice data and dashboard counts: file, redis or locmem (see leads/cache.py).
+# It must be shared by every process (web workers and the import worker); locmem is not.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'file')
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'nissie-crm'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', _CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '300')),
+        'KEY_PREFIX': 'nissie',
+    }
+}